@@ -3,9 +3,16 @@ from db_base import (
     DB_ITEM_NOT_FOUND,
     DB_ITEM_ALREADY_EXISTS,
     DB_ITEM_REFERENCED,
+    DB_QUOTA_EXCEEDED,
     DB_WRONG_STATUS,
 )
-from fastapi import HTTPException
+from fastapi import Header, HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from sqlmodel import Session
+from db_access import RequestKeyAccess
+from db_config import DEFAULT_NAMESPACE
+from db_profile import current_route
+from db_trace import tracer
 
 
 def handle_db_exceptions(func):
@@ -19,10 +26,90 @@ def handle_db_exceptions(func):
         except DB_ITEM_REFERENCED as e:
             raise HTTPException(status_code=409, detail=str(e))
         except DB_WRONG_STATUS as e:
-            raise HTTPException(status_code=500, detail=str(e))
+            raise HTTPException(status_code=409, detail=str(e))
+        except DB_QUOTA_EXCEEDED as e:
+            raise HTTPException(status_code=429, detail=str(e))
         except ResponseValidationError as e:
             raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
     return wrapper
+
+
+def idempotent(func, request_key: str | None, route: str, session: Session):
+    """
+    Replay the stored response when a request with the same Idempotency-Key
+    was already handled on the route, otherwise call func and remember its outcome.
+    """
+
+    def wrapper(*args, **kwargs):
+        if not request_key:
+            return func(*args, **kwargs)
+        response = RequestKeyAccess.get_response(request_key, route, session)
+        if response is not None:
+            return response
+        outcome = func(*args, **kwargs)
+        RequestKeyAccess.save_response(
+            request_key, route, outcome.model_dump(), session
+        )
+        return outcome
+
+    return wrapper
+
+
+def not_modified(req: Request, response: Response, etag: str) -> Response | None:
+    """
+    Set the ETag of the response and get an empty 304 response when the
+    client's If-None-Match already names it.
+    """
+    response.headers["ETag"] = etag
+    if_none_match = req.headers.get("if-none-match", "")
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+async def get_namespace(
+    x_namespace: str = Header(default=DEFAULT_NAMESPACE, pattern=r"^[\w.-]{1,64}$")
+) -> str:
+    """Dependency that gets the namespace of the request from the X-Namespace header"""
+    return x_namespace
+
+
+async def set_current_route(req: Request):
+    """Dependency that names the route of the request for the SQL profiler"""
+    route = req.scope.get("route")
+    current_route.set(route.path if route else req.url.path)
+
+
+class TracedRoute(APIRoute):
+    """
+    Route that runs the whole request (dependencies, handler and response
+    serialization) in a server span when tracing is enabled, continuing the
+    trace of an incoming traceparent header.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request: Request) -> Response:
+            if not tracer.enabled:
+                return await handler(request)
+            with tracer.span(
+                f"{request.method} {self.path}",
+                kind="server",
+                traceparent=request.headers.get("traceparent"),
+                **{"http.method": request.method, "http.route": self.path},
+            ) as span:
+                try:
+                    response = await handler(request)
+                except HTTPException as e:
+                    span.set_attribute("http.status_code", e.status_code)
+                    raise
+                span.set_attribute("http.status_code", response.status_code)
+                response.headers["traceparent"] = span.traceparent()
+                return response
+
+        return traced_handler
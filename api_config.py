@@ -0,0 +1,62 @@
+import json
+import os
+
+""" Settings for the api layer, taken from environment variables """
+
+# responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+
+# longest time a report tail request waits for new reports (seconds)
+REPORT_TAIL_MAX_WAIT = float(os.environ.get("REPORT_TAIL_MAX_WAIT", "30"))
+
+# interval at which a waiting tail re-checks the database for reports
+# written by other service processes (seconds)
+REPORT_TAIL_POLL = float(os.environ.get("REPORT_TAIL_POLL", "1"))
+
+# token bucket limits per client as {route prefix: [tokens per second, burst]},
+# "*" applies to routes without a more specific prefix, e.g. '{"*": [100, 200]}';
+# no limits by default
+RATE_LIMITS = json.loads(os.environ.get("RATE_LIMITS", "{}"))
+
+# header identifying the client for the rate limits, e.g. one set by a trusted
+# proxy (clients can send any value), the client address is used when unset
+RATE_LIMIT_CLIENT_HEADER = os.environ.get("RATE_LIMIT_CLIENT_HEADER", "")
+
+# where the token buckets are kept: "memory" (per process) or "database" (shared)
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory")
+
+# interval at which tool heartbeats collected in memory are written to the
+# database (seconds), must be well below TOOL_LIVENESS_TTL
+HEARTBEAT_FLUSH_INTERVAL = float(os.environ.get("HEARTBEAT_FLUSH_INTERVAL", "10"))
+
+# interval at which scheduled (not_before) and backed off tasks that are due
+# are made available (seconds)
+TASK_PROMOTE_INTERVAL = float(os.environ.get("TASK_PROMOTE_INTERVAL", "1"))
+
+# interval at which queue buckets older than FORECAST_WINDOW are deleted (seconds)
+FORECAST_PRUNE_INTERVAL = float(os.environ.get("FORECAST_PRUNE_INTERVAL", "60"))
+
+# non-critical requests are rejected while the average wait to check out a
+# database connection exceeds this many seconds
+LOAD_SHED_WAIT = float(os.environ.get("LOAD_SHED_WAIT", "0.5"))
+
+# routes that are never rate limited or shed, so that work can always complete
+CRITICAL_ROUTES = [
+    "/work/update/successful/",
+    "/work/update/failed/",
+    "/report/create/",
+]
+
+# record every API call (route, request headers listed in CAPTURE_HEADERS,
+# body, status and timing) as a JSON line in CAPTURE_FILE, to be played back
+# against another instance with replay.py
+CAPTURE = os.environ.get("CAPTURE", "0").lower() in ("1", "true", "yes")
+CAPTURE_FILE = os.environ.get("CAPTURE_FILE", "capture.jsonl")
+CAPTURE_HEADERS = [
+    "content-type",
+    "idempotency-key",
+    "if-none-match",
+    "range",
+    "x-client-id",
+    "x-namespace",
+]
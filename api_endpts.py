@@ -1,39 +1,70 @@
+import time
+from datetime import datetime
 from typing import List
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
 from sqlmodel import Session
-from api_base import handle_db_exceptions as db_ex
+from api_base import (
+    TracedRoute,
+    get_namespace,
+    handle_db_exceptions as db_ex,
+    idempotent,
+    not_modified,
+)
+from api_config import REPORT_TAIL_MAX_WAIT, REPORT_TAIL_POLL
+from api_events import report_events, tool_heartbeats
+from db_profile import query_profile
+from db_trace import tracer
 from db_base import get_db
+from db_config import TOOL_LIVENESS_TTL
+from db_keys import doc_signature
+import db_export
 from db_access import (
     ToolAccess as ToolAc,
     TaskAccess as TaskAc,
     WorkAccess as WorkAc,
     ArchiveAccess as ArchiveAc,
+    BlobAccess as BlobAc,
+    MatchAccess as MatchAc,
+    NamespaceAccess as NamespaceAc,
+    StatsAccess as StatsAc,
+    VersionAccess as VersionAc,
 )
 from db_models import DbTool, DbTask
 from api_models import (
     ArchiveInfo,
     BasicTask,
     BasicTool,
+    BatchOutcome,
     BriefArchive,
     BriefReport,
     BriefTask,
     BriefTool,
     BriefWork,
+    ExportOutcome,
+    FleetOutcome,
+    NamespaceUsage,
+    NeedsQuery,
     Outcome,
+    QueryStats,
+    QueueForecast,
     ReportCreate,
     TaskCreate,
+    TaskOutcome,
     ToolCreate,
+    ToolSelector,
+    ToolStats,
     WorkCreate,
     WorkInfo,
 )
 
 
-tool_router = APIRouter(prefix="/tool")
-task_router = APIRouter(prefix="/task")
-work_router = APIRouter(prefix="/work")
-archive_router = APIRouter(prefix="/archive")
-report_router = APIRouter(prefix="/report")
-general_router = APIRouter(prefix="/general")
+tool_router = APIRouter(prefix="/tool", route_class=TracedRoute)
+task_router = APIRouter(prefix="/task", route_class=TracedRoute)
+work_router = APIRouter(prefix="/work", route_class=TracedRoute)
+archive_router = APIRouter(prefix="/archive", route_class=TracedRoute)
+report_router = APIRouter(prefix="/report", route_class=TracedRoute)
+general_router = APIRouter(prefix="/general", route_class=TracedRoute)
+blob_router = APIRouter(prefix="/blob", route_class=TracedRoute)
 
 
 # ============================================================
@@ -43,6 +74,8 @@ doc = {
     "create_task": "Create a new task",
     "create_tool": "Create a new tool",
     "create_work": "Create a new work item",
+    "create_work_batch": "Create work items for a list of tool/task pairs",
+    "assign_work": "Create work items for available tasks on compatible tools, preferring co-located pairs",
     #
     "clear_tools": "Clear (delete all) tools",
     "clear_tasks": "Clear (delete all) tasks",
@@ -58,27 +91,50 @@ doc = {
     "mark_tool_disabled": "Update tool as disabled",
     "mark_tool_enabled": "Update tool as enabled",
     "tool_ready": "Update tool as ready for work",
+    "mark_tools_disabled": "Update the selected tools as disabled",
+    "mark_tools_enabled": "Update the selected tools as enabled",
+    "tools_ready": "Update the selected tools as ready for work, skipping tools without free work slots",
+    "requeue_task": "Reset the attempts of a (dead-lettered) task and make it available again",
     #
     "get_tools": "List of all tools",
     "get_tasks": "List of all tasks",
+    "get_dead_letter_tasks": "List of tasks that failed too often to be retried",
     "get_all_work": "List of all work",
     "get_archives": "List of all archived work items",
-    "available_tools": "List of all available tools",
-    "available_tasks": "List of all available tasks",
+    "available_tools": "List of all available tools, co-located tools first when a locality is given",
+    "available_tasks": "List of all available tasks, co-located tasks first when a locality is given",
+    "compatible_tools": "List of available tools whose skills satisfy the given needs",
+    "compatible_tasks": "List of available tasks whose needs are satisfied by the specified tool",
     "get_completed_work": "List of all completed work",
     "get_failed_work": "List of all failed work",
     "get_successful_work": "List of all successful work",
-    "get_reports": "List of all reports for a specific work item",
+    "get_reports": "List of reports for a specific work item, optionally after a cursor and waiting for new reports",
+    "get_all_tool_stats": "Throughput and latency statistics for all tools",
+    "get_signature_stats": "Throughput and latency statistics per skills signature, over all tools",
+    "get_queue_forecast": "Queue depth, arrival and service rates (per minute) and projected wait per needs signature",
+    "get_needs_forecast": "Queue depth, arrival and service rates (per minute) and projected wait for the given needs",
     #
     "get_tool": "Details for a specific tool",
     "get_task": "Details for a specific task",
     "get_work": "Details for  a specific work item",
     "get_archive": "Details for a specific archived work item",
+    "export_archive": "Export archived work items (one row per report) to date-partitioned Parquet or Arrow files in the export directory",
+    "get_tool_stats": "Throughput and latency statistics for a specific tool",
     #
-    "get_work_for_tool": "Details for assigned work for the specified tool",
+    "get_work_for_tool": "Details for assigned work for the specified tool (also a heartbeat of the tool)",
+    "get_work_items_for_tool": "Details for all work assigned to the specified tool (also a heartbeat of the tool)",
     #
     "mark_work_failed": "Update work as failed",
     "mark_work_succeeded": "Update work as successful",
+    #
+    "get_blob": "Content of an offloaded payload value (JSON), supports single byte ranges",
+    #
+    "rebuild_index": "Rebuild the index used to match task needs to tool skills",
+    "get_query_profile": "Top SQL statement counts and times per route and access method (SQL_PROFILE=1)",
+    "clear_query_profile": "Clear the SQL statement profile",
+    "get_namespace_usage": "Queued tasks and active work items of the request's namespace and their quotas",
+    "get_traces": "Recently exported trace spans, optionally of one trace (TRACE_SAMPLE_RATE > 0, memory exporter)",
+    "clear_traces": "Clear the recently exported trace spans",
 }
 
 # ============================================================
@@ -89,28 +145,115 @@ def server_status():
     return {"message": "API is running"}
 
 
+@general_router.get(
+    "/profile", response_model=List[QueryStats], summary=doc["get_query_profile"]
+)
+async def get_query_profile(
+    top: int = Query(default=20, ge=1),
+    order: str = Query(
+        default="total_time",
+        pattern="^(statements|rows|total_time|mean_time|max_time)$",
+    ),
+):
+    return query_profile.top(top, order)
+
+
+@general_router.delete(
+    "/profile", response_model=Outcome, summary=doc["clear_query_profile"]
+)
+async def clear_query_profile():
+    query_profile.reset()
+    return Outcome(message="Query profile cleared")
+
+
+@general_router.get("/traces", response_model=List[dict], summary=doc["get_traces"])
+async def get_traces(trace_id: str | None = None):
+    return tracer.exporter.get_spans(trace_id)
+
+
+@general_router.delete("/traces", response_model=Outcome, summary=doc["clear_traces"])
+async def clear_traces():
+    tracer.exporter.clear()
+    return Outcome(message="Traces cleared")
+
+
+@general_router.get(
+    "/namespace", response_model=NamespaceUsage, summary=doc["get_namespace_usage"]
+)
+async def get_namespace_usage(
+    namespace: str = Depends(get_namespace), db: Session = Depends(get_db)
+):
+    return db_ex(NamespaceAc.get_usage)(namespace, db)
+
+
+@general_router.put(
+    "/index/rebuild", response_model=Outcome, summary=doc["rebuild_index"]
+)
+async def rebuild_index(db: Session = Depends(get_db)):
+    return db_ex(MatchAc.rebuild_index)(db)
+
+
 # ============================================================
 
 
 @tool_router.post("/create/", response_model=Outcome, summary=doc["create_tool"])
 async def create_tool(
-    req: Request, new_tool: ToolCreate, db: Session = Depends(get_db)
+    req: Request,
+    new_tool: ToolCreate,
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+    idempotency_key: str | None = Header(default=None),
 ):
-    return db_ex(ToolAc.create_tool)(new_tool, db)
+    func = idempotent(ToolAc.create_tool, idempotency_key, req.url.path, db)
+    return db_ex(func)(new_tool, db, namespace)
 
 
-@task_router.post("/create/", response_model=Outcome, summary=doc["create_task"])
+@task_router.post("/create/", response_model=TaskOutcome, summary=doc["create_task"])
 async def create_task(
-    req: Request, task_create: TaskCreate, db: Session = Depends(get_db)
+    req: Request,
+    task_create: TaskCreate,
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+    idempotency_key: str | None = Header(default=None),
 ):
-    return db_ex(TaskAc.create_task)(task_create, db)
+    func = idempotent(TaskAc.create_task, idempotency_key, req.url.path, db)
+    return db_ex(func)(task_create, db, namespace)
 
 
 @work_router.post("/create/", response_model=Outcome, summary=doc["create_work"])
 async def create_work(
-    req: Request, work_create: WorkCreate, db: Session = Depends(get_db)
+    req: Request,
+    work_create: WorkCreate,
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+    idempotency_key: str | None = Header(default=None),
+):
+    func = idempotent(WorkAc.create_work, idempotency_key, req.url.path, db)
+    return db_ex(func)(work_create, db, namespace)
+
+
+@work_router.post(
+    "/create/batch", response_model=BatchOutcome, summary=doc["create_work_batch"]
+)
+async def create_work_batch(
+    req: Request,
+    pairs: List[WorkCreate],
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+    idempotency_key: str | None = Header(default=None),
 ):
-    return db_ex(WorkAc.create_work)(work_create, db)
+    func = idempotent(WorkAc.create_work_batch, idempotency_key, req.url.path, db)
+    return db_ex(func)(pairs, db, namespace)
+
+
+@work_router.post("/assign", response_model=BatchOutcome, summary=doc["assign_work"])
+async def assign_work(
+    req: Request,
+    limit: int | None = Query(default=None, ge=1),
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+):
+    return db_ex(WorkAc.assign_work)(db, limit, namespace)
 
 
 @report_router.post(
@@ -121,8 +264,12 @@ async def create_work_report(
     work_id: int,
     report_create: ReportCreate,
     db: Session = Depends(get_db),
+    idempotency_key: str | None = Header(default=None),
 ):
-    return db_ex(WorkAc.create_work_report)(work_id, report_create, db)
+    func = idempotent(WorkAc.create_work_report, idempotency_key, req.url.path, db)
+    outcome = db_ex(func)(work_id, report_create, db)
+    report_events.notify(work_id)
+    return outcome
 
 
 # ============================================================
@@ -151,6 +298,49 @@ async def mark_tool_disabled(req: Request, tool_id: str, db: Session = Depends(g
     return db_ex(ToolAc.tool_enable)(tool_id, False, db)
 
 
+@tool_router.put(
+    "/update/ready", response_model=FleetOutcome, summary=doc["tools_ready"]
+)
+async def tools_ready(
+    req: Request,
+    selector: ToolSelector,
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+):
+    return db_ex(ToolAc.tools_ready)(selector, db, namespace)
+
+
+@tool_router.put(
+    "/update/enable", response_model=FleetOutcome, summary=doc["mark_tools_enabled"]
+)
+async def mark_tools_enabled(
+    req: Request,
+    selector: ToolSelector,
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+):
+    return db_ex(ToolAc.tools_enable)(selector, True, db, namespace)
+
+
+@tool_router.put(
+    "/update/disable", response_model=FleetOutcome, summary=doc["mark_tools_disabled"]
+)
+async def mark_tools_disabled(
+    req: Request,
+    selector: ToolSelector,
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+):
+    return db_ex(ToolAc.tools_enable)(selector, False, db, namespace)
+
+
+@task_router.put(
+    "/update/requeue/{task_id}", response_model=Outcome, summary=doc["requeue_task"]
+)
+async def requeue_task(req: Request, task_id: str, db: Session = Depends(get_db)):
+    return db_ex(TaskAc.requeue_task)(task_id, db)
+
+
 @work_router.put(
     "/update/successful/{work_id}",
     response_model=Outcome,
@@ -160,8 +350,12 @@ async def mark_work_succeeded(
     req: Request,
     work_id: int,
     db: Session = Depends(get_db),
+    idempotency_key: str | None = Header(default=None),
 ):
-    return db_ex(WorkAc.work_succeeded)(work_id, db)
+    func = idempotent(WorkAc.work_succeeded, idempotency_key, req.url.path, db)
+    outcome = db_ex(func)(work_id, db)
+    report_events.notify(work_id)  # tails of the archived work stop waiting
+    return outcome
 
 
 @work_router.put(
@@ -171,8 +365,12 @@ async def mark_work_failed(
     req: Request,
     work_id: int,
     db: Session = Depends(get_db),
+    idempotency_key: str | None = Header(default=None),
 ):
-    return db_ex(WorkAc.work_failed)(work_id, db)
+    func = idempotent(WorkAc.work_failed, idempotency_key, req.url.path, db)
+    outcome = db_ex(func)(work_id, db)
+    report_events.notify(work_id)  # tails of the archived work stop waiting
+    return outcome
 
 
 # ============================================================
@@ -237,8 +435,10 @@ async def delete_archived_work(
 
 
 @tool_router.get("/list/", response_model=List[BriefTool], summary=doc["get_tools"])
-async def get_all_tools(req: Request, db: Session = Depends(get_db)):
-    tools_list = db_ex(ToolAc.get_all_tools)(db)
+async def get_all_tools(
+    req: Request, db: Session = Depends(get_db), namespace: str = Depends(get_namespace)
+):
+    tools_list = db_ex(ToolAc.get_all_tools)(db, namespace)
     return [BriefTool().from_tool(tool) for tool in tools_list]
 
 
@@ -249,21 +449,88 @@ async def get_all_tools(req: Request, db: Session = Depends(get_db)):
 )
 async def get_work_for_tool(req: Request, tool_id: str, db: Session = Depends(get_db)):
     work = db_ex(ToolAc.get_work_for_tool)(tool_id, db)
+    tool_heartbeats.beat(tool_id)
     if not work:
         return WorkInfo()
     return WorkInfo().from_work(work)
 
 
+@tool_router.get(
+    "/details/work/assignments/{tool_id}",
+    response_model=List[WorkInfo],
+    summary=doc["get_work_items_for_tool"],
+)
+async def get_work_items_for_tool(
+    req: Request, tool_id: str, db: Session = Depends(get_db)
+):
+    work_list = db_ex(ToolAc.get_work_items_for_tool)(tool_id, db)
+    tool_heartbeats.beat(tool_id)
+    return [WorkInfo().from_work(work) for work in work_list]
+
+
 @tool_router.get(
     "/list/available", response_model=List[BasicTool], summary=doc["available_tools"]
 )
-async def get_available_tools(req: Request, db: Session = Depends(get_db)):
-    items = db_ex(ToolAc.get_available_tools)(db)
+async def get_available_tools(
+    req: Request,
+    response: Response,
+    locality: str | None = None,
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+):
+    # tools drop out when their heartbeat expires, without a change to the table,
+    # while reviving a tool bumps its version, so the live count completes the tag
+    live = db_ex(ToolAc.count_live_tools)(db) if TOOL_LIVENESS_TTL else 0
+    etag = db_ex(VersionAc.get_etag)(["tools"], db, live, namespace, locality)
+    if unchanged := not_modified(req, response, etag):
+        return unchanged
+    items = db_ex(ToolAc.get_available_tools)(db, locality, namespace)
     if not items:
         return []
     return [BasicTool().from_tool(tool) for tool in items]
 
 
+@tool_router.post(
+    "/list/compatible",
+    response_model=List[BasicTool],
+    summary=doc["compatible_tools"],
+)
+async def get_compatible_tools(
+    req: Request,
+    needs: NeedsQuery,
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+):
+    items = db_ex(MatchAc.get_compatible_tools)(needs.task_needs, db, namespace)
+    return [BasicTool().from_tool(tool) for tool in items]
+
+
+@tool_router.get(
+    "/stats", response_model=List[ToolStats], summary=doc["get_all_tool_stats"]
+)
+async def get_all_tool_stats(req: Request, db: Session = Depends(get_db)):
+    items = db_ex(StatsAc.get_all_tool_stats)(db)
+    return [ToolStats().from_stats(item) for item in items]
+
+
+@tool_router.get(
+    "/signatures/stats",
+    response_model=List[ToolStats],
+    summary=doc["get_signature_stats"],
+)
+async def get_signature_stats(req: Request, db: Session = Depends(get_db)):
+    items = db_ex(StatsAc.get_signature_stats)(db)
+    return [ToolStats().from_stats(item) for item in items]
+
+
+@tool_router.get(
+    "/stats/{tool_id}", response_model=List[ToolStats], summary=doc["get_tool_stats"]
+)
+async def get_tool_stats(req: Request, tool_id: str, db: Session = Depends(get_db)):
+    items = db_ex(StatsAc.get_tool_stats)(tool_id, db)
+    return [ToolStats().from_stats(item) for item in items]
+
+
 @tool_router.get(
     "/details/{tool_id}", response_model=BriefTool, summary=doc["get_tool"]
 )
@@ -275,16 +542,62 @@ async def get_tool(req: Request, tool_id: str, db: Session = Depends(get_db)):
 @task_router.get(
     "/list/available", response_model=List[BasicTask], summary=doc["available_tasks"]
 )
-async def get_available_tasks(req: Request, db: Session = Depends(get_db)):
-    items = db_ex(TaskAc.get_available_tasks)(db)
+async def get_available_tasks(
+    req: Request,
+    response: Response,
+    locality: str | None = None,
+    db: Session = Depends(get_db),
+    namespace: str = Depends(get_namespace),
+):
+    etag = db_ex(VersionAc.get_etag)(["tasks"], db, namespace, locality)
+    if unchanged := not_modified(req, response, etag):
+        return unchanged
+    items = db_ex(TaskAc.get_available_tasks)(db, locality, namespace)
     if not items:
         return []
     return [BasicTask().from_task(task) for task in items]
 
 
+@task_router.get(
+    "/list/compatible/{tool_id}",
+    response_model=List[BasicTask],
+    summary=doc["compatible_tasks"],
+)
+async def get_compatible_tasks(req: Request, tool_id: str, db: Session = Depends(get_db)):
+    items = db_ex(MatchAc.get_compatible_tasks)(tool_id, db)
+    return [BasicTask().from_task(task) for task in items]
+
+
+@task_router.get(
+    "/forecast", response_model=List[QueueForecast], summary=doc["get_queue_forecast"]
+)
+async def get_queue_forecast(req: Request, db: Session = Depends(get_db)):
+    return db_ex(StatsAc.get_queue_forecast)(db)
+
+
+@task_router.post(
+    "/forecast", response_model=QueueForecast, summary=doc["get_needs_forecast"]
+)
+async def get_needs_forecast(req: Request, needs: NeedsQuery, db: Session = Depends(get_db)):
+    needs_hash = doc_signature(needs.task_needs)
+    return db_ex(StatsAc.get_queue_forecast)(db, needs_hash)[0]
+
+
+@task_router.get(
+    "/list/dead", response_model=List[BriefTask], summary=doc["get_dead_letter_tasks"]
+)
+async def get_dead_letter_tasks(
+    req: Request, db: Session = Depends(get_db), namespace: str = Depends(get_namespace)
+):
+    task_list = db_ex(TaskAc.get_dead_letter_tasks)(db, namespace)
+    return [BriefTask().from_task(task) for task in task_list]
+
+
 @task_router.get("/list/", response_model=list[BriefTask], summary=doc["get_tasks"])
-async def get_all_tasks(req: Request, db: Session = Depends(get_db)):
-    task_list = db_ex(TaskAc.get_all_tasks)(db)
+async def get_all_tasks(
+    req: Request, db: Session = Depends(get_db), namespace: str = Depends(get_namespace)
+):
+    task_list = db_ex(TaskAc.get_all_tasks)(db, namespace)
     return [BriefTask().from_task(task) for task in task_list]
 
 
@@ -297,16 +610,20 @@ async def get_task(req: Request, task_id: str, db: Session = Depends(get_db)):
 
 
 @work_router.get("/list/", response_model=List[BriefWork], summary=doc["get_all_work"])
-async def get_all_work(req: Request, db: Session = Depends(get_db)):
-    work_list = db_ex(WorkAc.get_all_work)(db)
+async def get_all_work(
+    req: Request, db: Session = Depends(get_db), namespace: str = Depends(get_namespace)
+):
+    work_list = db_ex(WorkAc.get_all_work)(db, namespace)
     return [BriefWork().from_work(work) for work in work_list]
 
 
 @work_router.get(
     "/list/completed", response_model=List[BriefWork], summary=doc["get_completed_work"]
 )
-async def get_all_completed_work(req: Request, db: Session = Depends(get_db)):
-    work_list = db_ex(WorkAc.get_all_completed_work)(db)
+async def get_all_completed_work(
+    req: Request, db: Session = Depends(get_db), namespace: str = Depends(get_namespace)
+):
+    work_list = db_ex(WorkAc.get_all_completed_work)(db, namespace)
     return [BriefWork().from_work(work) for work in work_list]
 
 
@@ -315,16 +632,20 @@ async def get_all_completed_work(req: Request, db: Session = Depends(get_db)):
     response_model=List[BriefWork],
     summary=doc["get_successful_work"],
 )
-async def get_all_successful_work(req: Request, db: Session = Depends(get_db)):
-    work_list = db_ex(WorkAc.get_all_successful_work)(db)
+async def get_all_successful_work(
+    req: Request, db: Session = Depends(get_db), namespace: str = Depends(get_namespace)
+):
+    work_list = db_ex(WorkAc.get_all_successful_work)(db, namespace)
     return [BriefWork().from_work(work) for work in work_list]
 
 
 @work_router.get(
     "/list/failed", response_model=List[BriefWork], summary=doc["get_failed_work"]
 )
-async def get_all_failed_work(req: Request, db: Session = Depends(get_db)):
-    work_list = db_ex(WorkAc.get_all_failed_work)(db)
+async def get_all_failed_work(
+    req: Request, db: Session = Depends(get_db), namespace: str = Depends(get_namespace)
+):
+    work_list = db_ex(WorkAc.get_all_failed_work)(db, namespace)
     return [BriefWork().from_work(work) for work in work_list]
 
 
@@ -337,22 +658,113 @@ async def get_work(req: Request, work_id: int, db: Session = Depends(get_db)):
 @report_router.get(
     "/list/{work_id}", response_model=List[BriefReport], summary=doc["get_reports"]
 )
-async def get_reports(req: Request, work_id: int, db: Session = Depends(get_db)):
-    reports = db_ex(WorkAc.get_work_reports)(work_id, db)
+async def get_reports(
+    req: Request,
+    work_id: int,
+    since_id: int | None = None,
+    after: datetime | None = None,
+    limit: int | None = Query(default=None, ge=1),
+    wait: float = Query(default=0, ge=0),
+    db: Session = Depends(get_db),
+):
+    reports = db_ex(WorkAc.get_work_reports)(work_id, db, since_id, after, limit)
+    deadline = time.monotonic() + min(wait, REPORT_TAIL_MAX_WAIT)
+    while not reports and (remaining := deadline - time.monotonic()) > 0:
+        if not db_ex(WorkAc.is_active)(work_id, db):
+            break  # completed and archived, no more reports will come
+        db.rollback()  # give the connection back to the pool while waiting
+        await report_events.wait(work_id, min(remaining, REPORT_TAIL_POLL))
+        reports = db_ex(WorkAc.get_work_reports)(work_id, db, since_id, after, limit)
     return [BriefReport().from_report(report) for report in reports]
 
 
 @archive_router.get(
     "/details/{work_id}", response_model=ArchiveInfo, summary=doc["get_archive"]
 )
-async def get_archived_work(req: Request, work_id: int, db: Session = Depends(get_db)):
+async def get_archived_work(
+    req: Request, response: Response, work_id: int, db: Session = Depends(get_db)
+):
+    etag = db_ex(VersionAc.get_etag)(["work_archive"], db)
+    if unchanged := not_modified(req, response, etag):
+        return unchanged
     item = db_ex(ArchiveAc.get_archived_work)(work_id, db)
     return ArchiveInfo().from_archive(item)
 
 
+@archive_router.post(
+    "/export", response_model=ExportOutcome, summary=doc["export_archive"]
+)
+# a plain def runs in the threadpool, a long export must not block the event loop
+def export_archive(
+    req: Request,
+    format: str = Query(default="parquet", pattern="^(parquet|arrow)$"),
+    since: datetime | None = None,
+    until: datetime | None = None,
+    db: Session = Depends(get_db),
+):
+    if db_export.pa is None:
+        raise HTTPException(status_code=501, detail="pyarrow is not installed")
+    total, files = db_ex(db_export.export_archive)(
+        db, file_format=format, since=since, until=until
+    )
+    return ExportOutcome(
+        message=f"{total} archived work items exported to {len(files)} files",
+        archived=total,
+        files=files,
+    )
+
+
 @archive_router.get(
     "/list/", response_model=List[BriefArchive], summary=doc["get_archives"]
 )
-async def get_all_archived_work(req: Request, db: Session = Depends(get_db)):
-    items = db_ex(ArchiveAc.get_all_archived_work)(db)
+async def get_all_archived_work(
+    req: Request, db: Session = Depends(get_db), namespace: str = Depends(get_namespace)
+):
+    items = db_ex(ArchiveAc.get_all_archived_work)(db, namespace)
     return [BriefArchive().from_archive(item) for item in items]
+
+
+# ============================================================
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Get the inclusive byte range of a single-range 'bytes=' header"""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+@blob_router.get("/{blob_hash}", summary=doc["get_blob"])
+async def get_blob(req: Request, blob_hash: str, db: Session = Depends(get_db)):
+    size = db_ex(BlobAc.get_blob_size)(blob_hash, db)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{blob_hash}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    range_header = req.headers.get("range")
+    if not range_header or size == 0:
+        content = db_ex(BlobAc.read_blob)(blob_hash, 0, max(size - 1, 0), db)
+        return Response(content, media_type="application/json", headers=headers)
+    byte_range = _parse_range(range_header, size)
+    if not byte_range:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+    start, end = byte_range
+    content = db_ex(BlobAc.read_blob)(blob_hash, start, end, db)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(
+        content, status_code=206, media_type="application/json", headers=headers
+    )
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+""" In-process notifications and state shared between requests """
+
+
+class WorkEvents:
+    """
+    Wakes up requests that are waiting for something to happen to a work item,
+    e.g. a new report. Only changes made by this process are signalled, so
+    waiters should still re-check the database periodically. notify may be
+    called from any thread.
+    """
+
+    def __init__(self):
+        self._waiters: dict[int, set] = defaultdict(set)
+
+    def notify(self, work_id: int):
+        for loop, event in self._waiters.pop(work_id, ()):
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, work_id: int, timeout: float) -> bool:
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        self._waiters[work_id].add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(work_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[work_id]
+
+
+report_events = WorkEvents()
+
+
+class ToolHeartbeats:
+    """
+    Time of the last heartbeat of each tool, kept in memory so that polls do
+    not write to the database; a background job drains it in batches.
+    """
+
+    def __init__(self):
+        self._seen: dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def beat(self, tool_id: str):
+        with self._lock:
+            self._seen[tool_id] = datetime.now()
+
+    def drain(self) -> dict[str, datetime]:
+        with self._lock:
+            seen, self._seen = self._seen, {}
+        return seen
+
+
+tool_heartbeats = ToolHeartbeats()
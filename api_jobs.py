@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from sqlmodel import Session
+import db_base as db
+from api_config import (
+    FORECAST_PRUNE_INTERVAL,
+    HEARTBEAT_FLUSH_INTERVAL,
+    TASK_PROMOTE_INTERVAL,
+)
+from api_events import tool_heartbeats
+from db_access import StatsAccess, TaskAccess, ToolAccess
+
+""" Periodic background jobs that run while the service is up """
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """
+    Runs a blocking function every interval seconds in a worker thread, and
+    once more at shutdown when final is set.
+    """
+
+    def __init__(self, name: str, interval: float, func, final: bool = False):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.final = final
+
+    async def run_once(self):
+        try:
+            await asyncio.to_thread(self.func)
+        except Exception:
+            logger.exception("Background job '%s' failed", self.name)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
+
+
+jobs: list[PeriodicJob] = []
+
+
+def periodic(name: str, interval: float, final: bool = False):
+    """Decorator that registers a function as a periodic job"""
+
+    def decorator(func):
+        jobs.append(PeriodicJob(name, interval, func, final))
+        return func
+
+    return decorator
+
+
+@asynccontextmanager
+async def lifespan(app):
+    tasks = [asyncio.create_task(job.run()) for job in jobs]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in jobs:
+            if job.final:
+                await job.run_once()
+
+
+# ----------------- Jobs -----------------
+
+
+@periodic("flush_heartbeats", HEARTBEAT_FLUSH_INTERVAL, final=True)
+def flush_heartbeats():
+    seen = tool_heartbeats.drain()
+    if not seen:
+        return
+    db.create_engine_and_tables()
+    with Session(db.engine) as session:
+        ToolAccess.record_heartbeats(seen, session)
+
+
+@periodic("promote_due_tasks", TASK_PROMOTE_INTERVAL)
+def promote_due_tasks():
+    db.create_engine_and_tables()
+    with Session(db.engine) as session:
+        promoted = TaskAccess.promote_due_tasks(session)
+    if promoted:
+        logger.info("%d scheduled tasks became available", promoted)
+
+
+@periodic("prune_queue_buckets", FORECAST_PRUNE_INTERVAL)
+def prune_queue_buckets():
+    db.create_engine_and_tables()
+    with Session(db.engine) as session:
+        StatsAccess.prune_queue_buckets(session)
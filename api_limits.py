@@ -0,0 +1,141 @@
+import asyncio
+import math
+import time
+from sqlalchemy import case, select
+from sqlmodel import Session
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+import db_base as db
+from api_config import (
+    CRITICAL_ROUTES,
+    LOAD_SHED_WAIT,
+    RATE_LIMIT_CLIENT_HEADER,
+    RATE_LIMIT_STORE,
+    RATE_LIMITS,
+)
+from db_models import DbRateBucket
+
+
+class MemoryBucketStore:
+    """Token buckets held by this process"""
+
+    blocking = False
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """
+        Take a token from the bucket, returning 0 when one was available or
+        else the number of seconds until one will be.
+        """
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+        self._buckets[key] = (tokens - 1, now)
+        return 0.0
+
+
+class DatabaseBucketStore:
+    """Token buckets kept in the database and shared by all service processes"""
+
+    blocking = True
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """
+        Take a token in a single upsert, which only writes the bucket when a
+        token was available, so concurrent callers never race on the row.
+        """
+        now = time.time()
+        db.create_engine_and_tables()
+        buckets = DbRateBucket.__table__.c
+        refill = buckets.tokens + (now - buckets.updated_at) * rate
+        tokens = case((refill > burst, burst), else_=refill)
+        with Session(db.engine) as session:
+            stmt = db.dialect_insert(session, DbRateBucket).values(
+                bucket_key=key, tokens=burst - 1, updated_at=now
+            )
+            taken = session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["bucket_key"],
+                    set_={"tokens": tokens - 1, "updated_at": now},
+                    where=tokens >= 1,
+                ).returning(buckets.tokens)
+            ).first()
+            if taken:
+                session.commit()
+                return 0.0
+            left, updated = session.execute(
+                select(buckets.tokens, buckets.updated_at).where(buckets.bucket_key == key)
+            ).one()
+            session.commit()
+        tokens = min(burst, left + (now - updated) * rate)
+        return max(1 - tokens, 0.01) / rate
+
+
+def _get_rule(path: str) -> tuple[str, list[float]] | None:
+    prefixes = [prefix for prefix in RATE_LIMITS if prefix != "*" and path.startswith(prefix)]
+    if prefixes:
+        prefix = max(prefixes, key=len)
+        return prefix, RATE_LIMITS[prefix]
+    if "*" in RATE_LIMITS:
+        return "*", RATE_LIMITS["*"]
+    return None
+
+
+class RateLimitMiddleware:
+    """
+    Push back on clients that poll too fast (429) and shed non-critical load
+    while database connections are scarce (503). Clients are identified by
+    the RATE_LIMIT_CLIENT_HEADER header when configured or else their address.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        if RATE_LIMIT_STORE == "database":
+            self.store = DatabaseBucketStore()
+        else:
+            self.store = MemoryBucketStore()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or any(path.startswith(r) for r in CRITICAL_ROUTES):
+            await self.app(scope, receive, send)
+            return
+
+        if db.checkout_monitor.current() > LOAD_SHED_WAIT:
+            response = self._reject(503, "Service is overloaded", 1.0)
+            await response(scope, receive, send)
+            return
+
+        rule = _get_rule(path)
+        if rule:
+            prefix, (rate, burst) = rule
+            client = None
+            if RATE_LIMIT_CLIENT_HEADER:
+                client = Headers(scope=scope).get(RATE_LIMIT_CLIENT_HEADER)
+            if not client and scope.get("client"):
+                client = scope["client"][0]
+            key = f"{client}|{prefix}"
+            if self.store.blocking:
+                retry_after = await asyncio.to_thread(self.store.take, key, rate, burst)
+            else:
+                retry_after = self.store.take(key, rate, burst)
+            if retry_after:
+                response = self._reject(429, "Too many requests", retry_after)
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    def _reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+        return JSONResponse(
+            {"detail": detail},
+            status_code=status_code,
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
@@ -0,0 +1,201 @@
+import atexit
+import base64
+import gzip
+import json
+import queue
+import threading
+import time
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from api_config import CAPTURE_FILE, CAPTURE_HEADERS, COMPRESSION_MIN_SIZE
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.lower())
+    return accepted
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class CompressionMiddleware:
+    """
+    Compress complete response bodies above a size threshold with brotli
+    (when installed) or gzip, depending on the client's Accept-Encoding.
+    Streamed and partial (range) responses are passed through unchanged.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+
+        async def send_compressed(message: Message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start_message["headers"])
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or "content-range" in headers
+            ):
+                await send(start_message)
+                start_message = None
+                await send(message)
+                return
+            body = _compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            start_message = None
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def encode_body(body: bytes) -> dict:
+    """Keep a request body as text when it is UTF-8, otherwise as base64"""
+    if not body:
+        return {}
+    try:
+        return {"body": body.decode()}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(body).decode()}
+
+
+class CaptureWriter:
+    """
+    Appends one JSON call record per line to a file. Records are queued and
+    written in batches by a background thread, so that requests never wait
+    for the file; the queue is drained when the process exits.
+    """
+
+    def __init__(self, path: str = CAPTURE_FILE):
+        self.path = path
+        self._queue: queue.SimpleQueue[dict | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="capture", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, record: dict):
+        self._queue.put(record)
+
+    def close(self):
+        """Write the queued records and stop the background thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            records = [self._queue.get()]
+            while not self._queue.empty():
+                records.append(self._queue.get())
+            if None in records:
+                stopped = True
+                records = [record for record in records if record is not None]
+            if not records:
+                continue
+            lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+            with open(self.path, "a") as file:
+                file.write(lines)
+
+
+class CaptureMiddleware:
+    """
+    Record each API call for replay: when it started, the method, path, query,
+    route template, the request headers in CAPTURE_HEADERS, the request body,
+    the response status and size, and the time until the last response byte.
+    """
+
+    def __init__(self, app: ASGIApp, writer: CaptureWriter | None = None):
+        self.app = app
+        self.writer = writer or CaptureWriter()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.time()
+        start = time.perf_counter()
+        chunks: list[bytes] = []
+        status = 500
+        size = 0
+
+        async def receive_recorded() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def send_recorded(message: Message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_recorded, send_recorded)
+        finally:
+            headers = Headers(scope=scope)
+            route = scope.get("route")
+            self.writer.write(
+                {
+                    "ts": started,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode(),
+                    "route": route.path if route else scope["path"],
+                    "headers": {
+                        name: headers[name] for name in CAPTURE_HEADERS if name in headers
+                    },
+                    **encode_body(b"".join(chunks)),
+                    "status": status,
+                    "response_bytes": size,
+                    "duration_ms": (time.perf_counter() - start) * 1000,
+                }
+            )
@@ -3,7 +3,8 @@ from typing import Dict, List
 from pydantic import BaseModel
 from sqlalchemy import JSON, Column
 from sqlmodel import Field
-from db_models import DbArchive, DbTool, DbTask, DbWork, DbReport
+from db_models import DbArchive, DbTool, DbTask, DbWork, DbReport, DbToolStats
+from db_trace import traced_class
 
 
 # ============================================================
@@ -12,76 +13,160 @@ from db_models import DbArchive, DbTool, DbTask, DbWork, DbReport
 class ToolCreate(BaseModel):
     tool_id: str
     tool_skills: Dict
+    capacity: int = Field(default=1, ge=1)
 
 
 class ToolUpdate(BaseModel):
     tool_skills: Dict
 
 
+class ToolSelector(BaseModel):
+    """Tools listed by id and/or having all of the given skills"""
+
+    tool_ids: List[str] | None = None
+    tool_skills: Dict | None = None
+
+
+@traced_class("from_")
 class BriefTool(BaseModel):
     tool_id: str | None = None
+    namespace: str | None = None
     enabled: bool | None = None
     ready_since: datetime | None = None
+    last_seen: str | None = None
+    capacity: int | None = None
+    free_slots: int | None = None
+    work_ids: List[int] | None = None
     work_id: int | None = None
     task_id: str | None = None
     status: str | None = None
     complete: bool | None = None
 
     def from_tool(self, tool: DbTool):
+        work = tool.work_items[0] if tool.work_items else None
         self.tool_id = tool.tool_id
-        self.work_id = tool.work_id if tool.work else None
-        self.task_id = tool.work.task.task_id if tool.work else None
-        self.complete = tool.work.completed if tool.work else None
-        self.status = tool.work.status if tool.work else None
+        self.namespace = tool.namespace
+        self.capacity = tool.capacity
+        self.free_slots = tool.free_slots
+        self.work_ids = [item.work_id for item in tool.work_items]
+        self.work_id = work.work_id if work else None
+        self.task_id = work.task.task_id if work else None
+        self.complete = work.completed if work else None
+        self.status = work.status if work else None
         self.enabled = tool.enabled
-        self.ready_since = tool.ready_since.strftime("%Y-%m-%d %H:%M:%S")
+        if tool.ready_since:
+            self.ready_since = tool.ready_since.strftime("%Y-%m-%d %H:%M:%S")
+        if tool.last_seen:
+            self.last_seen = tool.last_seen.strftime("%Y-%m-%d %H:%M:%S")
         return self
 
 
+@traced_class("from_")
 class BasicTool(BaseModel):
     tool_id: str | None = None
+    namespace: str | None = None
     tool_skills: Dict | None = None
+    free_slots: int | None = None
+    locality: str | None = None
     created_at: datetime | None = None
     ready_since: datetime | None = None
 
     def from_tool(self, tool: DbTool):
         self.tool_id = tool.tool_id
+        self.namespace = tool.namespace
         self.tool_skills = tool.tool_skills
+        self.free_slots = tool.free_slots
+        self.locality = tool.locality
         self.created_at = tool.created_at.strftime("%Y-%m-%d %H:%M:%S")
         self.ready_since = tool.ready_since.strftime("%Y-%m-%d %H:%M:%S")
         return self
 
 
+@traced_class("from_")
+class ToolStats(BaseModel):
+    tool_id: str | None = None
+    skills_signature: str | None = None
+    completed: int | None = None
+    succeeded: int | None = None
+    failed: int | None = None
+    success_rate: float | None = None
+    mean_wait_seconds: float | None = None
+    mean_run_seconds: float | None = None
+    max_wait_seconds: float | None = None
+    max_run_seconds: float | None = None
+    updated_at: str | None = None
+
+    def from_stats(self, stats: DbToolStats):
+        self.tool_id = stats.tool_id
+        self.skills_signature = stats.skills_signature
+        self.completed = stats.completed
+        self.succeeded = stats.succeeded
+        self.failed = stats.failed
+        if stats.completed:
+            self.success_rate = stats.succeeded / stats.completed
+            self.mean_wait_seconds = stats.total_wait / stats.completed
+            self.mean_run_seconds = stats.total_run / stats.completed
+        self.max_wait_seconds = stats.max_wait
+        self.max_run_seconds = stats.max_run
+        self.updated_at = stats.updated_at.strftime("%Y-%m-%d %H:%M:%S")
+        return self
+
+
 # ============================================================
 class TaskCreate(BaseModel):
     task_id: str = Field(default=None, primary_key=True)
     task_needs: Dict = Field(sa_column=Column(JSON))
+    max_attempts: int | None = Field(default=None, ge=1)
+    locality: str | None = None
+    not_before: datetime | None = None
+    depends_on: List[str] = []
+
 
+class NeedsQuery(BaseModel):
+    task_needs: Dict
 
+
+@traced_class("from_")
 class BriefTask(BaseModel):
     task_id: str | None = None
+    namespace: str | None = None
     work_id: int | None = None
     tool_id: str | None = None
     status: str | None = None
     complete: bool | None = None
+    attempts: int | None = None
+    eligible_at: str | None = None
+    dead_letter: bool | None = None
+    pending_deps: int | None = None
 
     def from_task(self, task: DbTask):
         self.task_id = task.task_id
+        self.namespace = task.namespace
         self.work_id = task.work_id
+        self.attempts = task.attempts
+        self.dead_letter = task.dead_letter
+        self.pending_deps = task.pending_deps
+        if task.eligible_at:
+            self.eligible_at = task.eligible_at.strftime("%Y-%m-%d %H:%M:%S")
         self.tool_id = task.work.tool.tool_id if task.work else None
         self.complete = task.work.completed if task.work else None
         self.status = task.work.status if task.work else None
         return self
 
 
+@traced_class("from_")
 class BasicTask(BaseModel):
     task_id: str | None = None
+    namespace: str | None = None
     task_needs: Dict | None = None
+    locality: str | None = None
     created_at: datetime | None = None
 
     def from_task(self, task: DbTask):
         self.task_id = task.task_id
+        self.namespace = task.namespace
         self.task_needs = task.task_needs
+        self.locality = task.locality
         self.created_at = task.created_at.strftime("%Y-%m-%d %H:%M:%S")
         return self
 
@@ -94,30 +179,38 @@ class WorkCreate(BaseModel):
     task_id: str
 
 
+@traced_class("from_")
 class BriefWork(BaseModel):
     work_id: int | None = None
+    namespace: str | None = None
     status: str | None = None
     completed: bool | None = None
     tool_id: str | None = None
     task_id: str | None = None
+    version: int | None = None
 
     def from_work(self, work: DbWork):
         self.work_id = work.work_id
+        self.namespace = work.namespace
         self.status = work.status
         self.completed = work.completed
+        self.version = work.version
         self.tool_id = work.tool.tool_id
         self.task_id = work.task.task_id
         return self
 
 
+@traced_class("from_")
 class WorkInfo(BriefWork):
     tool_skills: Dict | None = None
     task_needs: Dict | None = None
+    upstream: Dict | None = None
 
     def from_work(self, work: DbWork):
         super().from_work(work)
         self.tool_skills = work.tool.tool_skills
         self.task_needs = work.task.task_needs
+        self.upstream = work.task.upstream
         return self
 
 
@@ -129,12 +222,15 @@ class ReportCreate(BaseModel):
     details: Dict
 
 
+@traced_class("from_")
 class BriefReport(BaseModel):
+    id: int | None = None
     status: str | None = None
     details: Dict | None = None
     created_at: str | None = None
 
     def from_report(self, report: DbReport):
+        self.id = report.id
         self.status = report.status
         self.details = report.details
         self.created_at = report.created_at.strftime("%Y-%m-%d %H:%M:%S")
@@ -144,24 +240,30 @@ class BriefReport(BaseModel):
 # ============================================================
 
 
+@traced_class("from_")
 class BriefArchive(BaseModel):
     work_id: int | None = None
+    namespace: str | None = None
     status: str | None = None
     tool_id: str | None = None
     task_id: str | None = None
+    memo_of: int | None = None
     created_at: str | None = None
     archived_at: str | None = None
 
     def from_archive(self, archive: DbArchive):
         self.work_id = archive.work_id
+        self.namespace = archive.namespace
         self.status = archive.status
         self.tool_id = archive.tool_id
         self.task_id = archive.task_id
+        self.memo_of = archive.memo_of
         self.created_at = archive.created_at.strftime("%Y-%m-%d %H:%M:%S")
         self.archived_at = archive.archived_at.strftime("%Y-%m-%d %H:%M:%S")
         return self
 
 
+@traced_class("from_")
 class ArchiveInfo(BriefArchive):
     task_needs: Dict | None = None
     tool_skills: Dict | None = None
@@ -175,7 +277,73 @@ class ArchiveInfo(BriefArchive):
         return self
 
 
+# ============================================================
+
+
+class QueryStats(BaseModel):
+    route: str
+    method: str
+    statements: int
+    rows: int
+    total_time: float
+    mean_time: float
+    max_time: float
+
+
 # ============================================================
 class Outcome(BaseModel):
     message: str
     success: bool = True
+
+
+class TaskOutcome(Outcome):
+    task_id: str | None = None
+    work_id: int | None = None
+
+
+class WorkConflict(BaseModel):
+    tool_id: str
+    task_id: str
+    reason: str
+
+
+class BatchOutcome(Outcome):
+    work_ids: List[int] = []
+    conflicts: List[WorkConflict] = []
+
+
+class ToolSkipped(BaseModel):
+    tool_id: str
+    reason: str
+
+
+class FleetOutcome(Outcome):
+    tool_ids: List[str] = []
+    skipped: List[ToolSkipped] = []
+
+
+class QueueForecast(BaseModel):
+    """Queue depth and rates (per minute) for one needs signature"""
+
+    needs_hash: str
+    depth: int = 0
+    arrival_rate: float = 0.0
+    service_rate: float = 0.0
+    oldest_wait_seconds: float | None = None
+    projected_wait_seconds: float | None = None
+
+
+class ExportOutcome(Outcome):
+    archived: int = 0
+    files: List[str] = []
+
+
+class NamespaceUsage(BaseModel):
+    """Queued tasks and active work items of a namespace and their quotas"""
+
+    namespace: str
+    tools: int = 0
+    queued_tasks: int = 0
+    active_work: int = 0
+    task_quota: int | None = None
+    work_quota: int | None = None
@@ -1,40 +1,110 @@
-from datetime import datetime
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict
+from sqlalchemy import and_, bindparam, case, delete, func, insert, not_, or_, true, update
 from sqlmodel import Session, select
 import db_base as db
+from db_config import (
+    BLOB_DIR,
+    BLOB_STORE,
+    BLOB_THRESHOLD,
+    DEFAULT_NAMESPACE,
+    FORECAST_BUCKET,
+    FORECAST_WINDOW,
+    IDEMPOTENCY_TTL,
+    LOCALITY_FALLBACK_DELAY,
+    LOCALITY_SKILL_KEY,
+    MEMO_MAX_AGE,
+    NAMESPACE_QUOTAS,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+    TASK_MAX_ATTEMPTS,
+    TASK_DEDUP,
+    TASK_DEDUP_WINDOW,
+    TASK_MEMOIZE,
+    TOOL_LIVENESS_TTL,
+)
 from db_models import (
     DbTool,
     DbTask,
+    DbTaskDep,
     DbWork,
     DbReport,
     DbArchive,
+    DbRequestKey,
+    DbSkillIndex,
+    DbNeedIndex,
+    DbTableVersion,
+    DbToolStats,
+    DbQueueBucket,
+    DbMemo,
+    DbBlob,
     work_status,
+    work_transitions,
+    work_sources,
+)
+from db_keys import (
+    ANY_KEY,
+    BLOB_KEY,
+    blob_hash,
+    canonical_json,
+    doc_signature,
+    is_blob_ref,
+    is_large,
+    skill_keys,
 )
+from db_trace import traced_class, untraced
 from api_models import (
+    BatchOutcome,
+    FleetOutcome,
+    NamespaceUsage,
     Outcome,
+    QueueForecast,
+    TaskOutcome,
     ToolCreate,
+    ToolSelector,
+    ToolSkipped,
     TaskCreate,
     WorkCreate,
+    WorkConflict,
     ReportCreate,
 )
 
 # ----------------- Tool functions -----------------
 
 
+@traced_class()
 class ToolAccess:
     @staticmethod
-    def create_tool(tool_create: ToolCreate, session: Session) -> Outcome:
-        result = session.exec(
-            select(DbTool).where(DbTool.tool_id == tool_create.tool_id)
-        )
-        exsisting_tool = result.one_or_none()
-        if exsisting_tool:
-            raise db.DB_ITEM_ALREADY_EXISTS(
-                f"Tool '{exsisting_tool.tool_id}' already exists"
+    def create_tool(
+        tool_create: ToolCreate, session: Session, namespace: str = DEFAULT_NAMESPACE
+    ) -> Outcome:
+        stmt = (
+            db.dialect_insert(session, DbTool)
+            .values(
+                **tool_create.model_dump(),
+                namespace=namespace,
+                free_slots=tool_create.capacity,
+                skills_signature=doc_signature(tool_create.tool_skills),
+                locality=ToolAccess.get_locality(tool_create.tool_skills),
             )
-        tool = DbTool(**tool_create.model_dump())
-        session.add(tool)
+            .on_conflict_do_nothing(index_elements=["tool_id"])
+        )
+        result = session.execute(stmt)
         session.commit()
-        return Outcome(message=f"Tool {tool.tool_id} created successfully")
+        if result.rowcount == 0:
+            exsisting_tool = ToolAccess.get_tool(tool_create.tool_id, session)
+            if (
+                exsisting_tool.tool_skills != tool_create.tool_skills
+                or exsisting_tool.capacity != tool_create.capacity
+                or exsisting_tool.namespace != namespace
+            ):
+                raise db.DB_ITEM_ALREADY_EXISTS(
+                    f"Tool '{exsisting_tool.tool_id}' already exists"
+                )
+            return Outcome(message=f"Tool {tool_create.tool_id} already exists")
+        return Outcome(message=f"Tool {tool_create.tool_id} created successfully")
 
     @staticmethod
     def tool_ready(tool_id: str, session: Session) -> Outcome:
@@ -43,14 +113,17 @@ class ToolAccess:
             return Outcome(message=f"Tool '{tool_id}' does not exist", success=False)
         if not tool.enabled:
             tool.ready_since = None
+            MatchAccess.sync_tool(tool, session)
             session.commit()
             return Outcome(message=f"Tool '{tool_id}' is not enabled", success=False)
-        if tool.work and tool.work.status != work_status.NEW:
+        if tool.free_slots <= 0:
             return Outcome(
-                message=f"Tool '{tool_id}' is assigned to active work item '{tool.work_id}'",
+                message=f"Tool '{tool_id}' has no free work slots",
                 success=False,
             )
         tool.ready_since = datetime.now()
+        tool.last_seen = tool.ready_since
+        MatchAccess.sync_tool(tool, session)
         session.commit()
         return Outcome(message=f"Tool {tool.tool_id} is set as ready")
 
@@ -60,9 +133,96 @@ class ToolAccess:
         if not tool:
             return Outcome(message=f"Tool '{tool_id}' does not exist", success=False)
         tool.enabled = enable
+        MatchAccess.sync_tool(tool, session)
         session.commit()
         return Outcome(message=f"Tool {tool.tool_id} enabled = {enable}")
 
+    @staticmethod
+    def tools_ready(
+        selector: ToolSelector, session: Session, namespace: str | None = None
+    ) -> FleetOutcome:
+        """Set the selected tools ready with a single UPDATE"""
+        tools, skipped = ToolAccess._select_tools(selector, session, namespace)
+        ready_ids = []
+        for tool_id, enabled, free_slots in tools:
+            if not enabled:
+                skipped.append(ToolSkipped(tool_id=tool_id, reason="Tool is not enabled"))
+            elif free_slots <= 0:
+                skipped.append(
+                    ToolSkipped(tool_id=tool_id, reason="Tool has no free work slots")
+                )
+            else:
+                ready_ids.append(tool_id)
+        if ready_ids:
+            now = datetime.now()
+            session.execute(
+                update(DbTool)
+                .where(DbTool.tool_id.in_(ready_ids))
+                .values(ready_since=now, last_seen=now)
+            )
+            MatchAccess.sync_tools(ready_ids, session)
+        session.commit()
+        return FleetOutcome(
+            message=f"{len(ready_ids)} tools are set as ready, {len(skipped)} skipped",
+            success=not skipped,
+            tool_ids=ready_ids,
+            skipped=skipped,
+        )
+
+    @staticmethod
+    def tools_enable(
+        selector: ToolSelector,
+        enable: bool,
+        session: Session,
+        namespace: str | None = None,
+    ) -> FleetOutcome:
+        """Enable or disable the selected tools with a single UPDATE"""
+        tools, skipped = ToolAccess._select_tools(selector, session, namespace)
+        tool_ids = [tool_id for tool_id, _, _ in tools]
+        if tool_ids:
+            session.execute(
+                update(DbTool).where(DbTool.tool_id.in_(tool_ids)).values(enabled=enable)
+            )
+            MatchAccess.sync_tools(tool_ids, session)
+        session.commit()
+        return FleetOutcome(
+            message=f"{len(tool_ids)} tools enabled = {enable}, {len(skipped)} skipped",
+            success=not skipped,
+            tool_ids=tool_ids,
+            skipped=skipped,
+        )
+
+    @staticmethod
+    def _select_tools(
+        selector: ToolSelector, session: Session, namespace: str | None = None
+    ) -> tuple[list[tuple], list[ToolSkipped]]:
+        """
+        Get (tool_id, enabled, free_slots) of the tools matched by the selector
+        (in the namespace when given), and the listed tool ids that do not exist.
+        """
+        if selector.tool_ids is None and selector.tool_skills is None:
+            return [], []
+        stmt = select(DbTool.tool_id, DbTool.tool_skills, DbTool.enabled, DbTool.free_slots)
+        if selector.tool_ids is not None:
+            stmt = stmt.where(DbTool.tool_id.in_(selector.tool_ids))
+        if namespace is not None:
+            stmt = stmt.where(DbTool.namespace == namespace)
+        rows = session.exec(stmt.order_by(DbTool.tool_id)).all()
+        found = {row[0] for row in rows}
+        skipped = [
+            ToolSkipped(tool_id=tool_id, reason="Tool does not exist")
+            for tool_id in dict.fromkeys(selector.tool_ids or [])
+            if tool_id not in found
+        ]
+        # skills documents are JSON, so the selector is evaluated on their keys
+        wanted = set(skill_keys(selector.tool_skills or {}))
+        tools = [
+            (tool_id, enabled, free_slots)
+            for tool_id, tool_skills, enabled, free_slots in rows
+            if wanted.issubset(skill_keys(tool_skills))
+        ]
+        return tools, skipped
+
     @staticmethod
     def delete_tool(tool_id: str, session: Session) -> Outcome:
         tool = session.exec(
@@ -77,12 +237,16 @@ class ToolAccess:
         items = session.exec(select(DbTool)).all()
         for item in items:
             session.delete(item)
+        session.execute(delete(DbSkillIndex))
         session.commit()
         return Outcome(message=f"{len(items)} tools were deleted")
 
     @staticmethod
-    def get_all_tools(session: Session) -> list[DbTool]:
-        result = session.exec(select(DbTool))
+    def get_all_tools(session: Session, namespace: str | None = None) -> list[DbTool]:
+        stmt = select(DbTool)
+        if namespace is not None:
+            stmt = stmt.where(DbTool.namespace == namespace)
+        result = session.exec(stmt)
         return result.all()
 
     @staticmethod
@@ -98,17 +262,86 @@ class ToolAccess:
         tool = ToolAccess.get_tool(tool_id, session)
         if not tool:
             return None
-        if not tool.work:
+        if not tool.work_items:
             return None
-        return tool.work
+        return tool.work_items[0]
+
+    @staticmethod
+    def get_work_items_for_tool(tool_id: str, session: Session) -> list[DbWork]:
+        tool = ToolAccess.get_tool(tool_id, session)
+        return tool.work_items
+
+    @staticmethod
+    def record_heartbeats(seen: dict[str, datetime], session: Session) -> None:
+        """
+        Store the last heartbeat of many tools with one executemany UPDATE.
+        Heartbeats of tools that are live already do not change the available
+        tools, so they leave the table version (and the ETags) alone.
+        """
+        revived = 0
+        if TOOL_LIVENESS_TTL:
+            revived = session.exec(
+                select(func.count())
+                .select_from(DbTool)
+                .where(
+                    DbTool.tool_id.in_(list(seen)),
+                    or_(DbTool.last_seen == None, not_(ToolAccess.is_live())),
+                )
+            ).one()
+        tools = DbTool.__table__
+        session.execute(
+            update(tools)
+            .where(tools.c.tool_id == bindparam("b_tool_id"))
+            .values(last_seen=bindparam("b_last_seen"))
+            .execution_options(bump_versions=bool(revived)),
+            [
+                {"b_tool_id": tool_id, "b_last_seen": last_seen}
+                for tool_id, last_seen in seen.items()
+            ],
+        )
+        session.commit()
+
+    @staticmethod
+    @untraced
+    def is_live():
+        """Condition for tools that sent a heartbeat within TOOL_LIVENESS_TTL"""
+        if not TOOL_LIVENESS_TTL:
+            return true()
+        return DbTool.last_seen >= datetime.now() - timedelta(seconds=TOOL_LIVENESS_TTL)
+
+    @staticmethod
+    def count_live_tools(session: Session) -> int:
+        """Count the live tools, the count drops whenever a heartbeat expires"""
+        return session.exec(
+            select(func.count()).select_from(DbTool).where(ToolAccess.is_live())
+        ).one()
 
     @staticmethod
-    def get_available_tools(session: Session) -> list[DbTool]:
+    @untraced
+    def get_locality(tool_skills: Dict) -> str | None:
+        locality = tool_skills.get(LOCALITY_SKILL_KEY)
+        return str(locality) if locality is not None else None
+
+    @staticmethod
+    def get_available_tools(
+        session: Session, locality: str | None = None, namespace: str | None = None
+    ) -> list[DbTool]:
+        """Available tools, co-located tools first when a locality is given"""
+        order = [DbTool.free_slots.desc(), DbTool.ready_since.desc()]
+        if locality is not None:
+            order.insert(0, (DbTool.locality == locality).desc())
         tools_stmt = (
             select(DbTool)
-            .where(DbTool.work_id == None, DbTool.ready_since != None)
-            .order_by(DbTool.ready_since.desc())
+            .where(
+                DbTool.enabled == True,
+                DbTool.free_slots > 0,
+                DbTool.ready_since != None,
+                ToolAccess.is_live(),
+            )
+            .order_by(*order)
         )
+        if namespace is not None:
+            tools_stmt = tools_stmt.where(DbTool.namespace == namespace)
         tools = session.exec(tools_stmt).all()
         if not tools:
             return []
@@ -118,21 +351,247 @@ class ToolAccess:
 # ----------------- Task functions -----------------
 
 
+@traced_class()
 class TaskAccess:
     @staticmethod
-    def create_task(task_create: TaskCreate, session: Session) -> Outcome:
-        result = session.exec(
-            select(DbTask).where(DbTask.task_id == task_create.task_id)
+    def create_task(
+        task_create: TaskCreate, session: Session, namespace: str = DEFAULT_NAMESPACE
+    ) -> TaskOutcome:
+        task_id = task_create.task_id
+        needs_hash = doc_signature(task_create.task_needs)
+        dedup_key = TaskAccess._get_dedup_key(needs_hash, namespace)
+        # a dependent or scheduled task's result also depends on data that
+        # has not landed yet
+        reusable = not task_create.depends_on and not task_create.not_before
+        pending, upstream = TaskAccess._resolve_dependencies(
+            task_create.depends_on, namespace, session
         )
-        exsisting_task = result.one_or_none()
+        if TASK_DEDUP and reusable:
+            archive = TaskAccess._get_recent_success(needs_hash, namespace, session)
+            if archive:
+                return TaskOutcome(
+                    message=f"Task needs already succeeded as task {archive.task_id} in work item {archive.work_id}",
+                    task_id=archive.task_id,
+                    work_id=archive.work_id,
+                )
+        if TASK_MEMOIZE and reusable and not session.get(DbTask, task_id):
+            memo = MemoAccess.find_memo(needs_hash, namespace, session)
+            if memo:
+                return MemoAccess.complete_from_memo(
+                    task_create, memo, session, namespace
+                )
+        if NamespaceAccess.is_over_quota(namespace, "tasks", session) and not session.get(
+            DbTask, task_id
+        ):
+            raise db.DB_QUOTA_EXCEEDED(
+                f"Namespace '{namespace}' has reached its quota of queued tasks"
+            )
+        task_needs = BlobAccess.offload(task_create.task_needs, session)
+        stmt = (
+            db.dialect_insert(session, DbTask)
+            .values(
+                **task_create.model_dump(
+                    exclude={"depends_on", "task_needs", "not_before"}
+                ),
+                namespace=namespace,
+                eligible_at=TaskAccess._get_due_time(task_create.not_before),
+                task_needs=task_needs,
+                needs_hash=needs_hash,
+                dedup_key=dedup_key if TASK_DEDUP and reusable else None,
+                pending_deps=len(pending),
+                upstream=upstream or None,
+            )
+            .on_conflict_do_nothing()
+        )
+        result = session.execute(stmt)
+        if result.rowcount:
+            session.add_all(
+                DbTaskDep(task_id=task_id, depends_on=parent_id) for parent_id in pending
+            )
+            MatchAccess.add_task(task_id, task_create.task_needs, session)
+            StatsAccess.record_queue_event(needs_hash, session, arrivals=1)
+        session.commit()
+        if result.rowcount:
+            return TaskOutcome(
+                message=f"Task {task_id} created successfully", task_id=task_id
+            )
+
+        exsisting_task = session.get(DbTask, task_id)
         if exsisting_task:
+            if (
+                exsisting_task.task_needs != task_needs
+                or exsisting_task.namespace != namespace
+            ):
+                raise db.DB_ITEM_ALREADY_EXISTS(
+                    f"Task '{exsisting_task.task_id}' already exists"
+                )
+            return TaskOutcome(
+                message=f"Task {task_id} already exists",
+                task_id=task_id,
+                work_id=exsisting_task.work_id,
+            )
+        duplicate = session.exec(
+            select(DbTask).where(DbTask.dedup_key == dedup_key)
+        ).one_or_none()
+        if not duplicate:
             raise db.DB_ITEM_ALREADY_EXISTS(
-                f"Task '{exsisting_task.task_id}' already exists"
+                f"Task '{task_id}' conflicted with a task that no longer exists, retry"
             )
-        task = DbTask(**task_create.model_dump())
-        session.add(task)
-        session.commit()
-        return Outcome(message=f"Task {task.task_id} created successfully")
+        return TaskOutcome(
+            message=f"Task {task_id} has the same needs as existing task {duplicate.task_id}",
+            task_id=duplicate.task_id,
+            work_id=duplicate.work_id,
+        )
+
+    @staticmethod
+    def _get_dedup_key(needs_hash: str, namespace: str) -> str:
+        """Tasks only collapse within a namespace, default keys are plain hashes"""
+        if namespace == DEFAULT_NAMESPACE:
+            return needs_hash
+        return f"{namespace}:{needs_hash}"
+
+    @staticmethod
+    def _get_due_time(not_before: datetime | None) -> datetime | None:
+        """Get the eligible_at of a new task, None when it is already due"""
+        if not_before is None:
+            return None
+        if not_before.tzinfo:
+            # stored times are naive local times
+            not_before = not_before.astimezone().replace(tzinfo=None)
+        return not_before if not_before > datetime.now() else None
+
+    @staticmethod
+    def _resolve_dependencies(
+        depends_on: list[str], namespace: str, session: Session
+    ) -> tuple[list[str], dict]:
+        """
+        Split the upstream tasks (of the same namespace) into those still
+        pending and those that already succeeded, with the final report
+        details of the latter.
+        """
+        parent_ids = list(dict.fromkeys(depends_on))
+        if not parent_ids:
+            return [], {}
+        parents = session.exec(
+            select(DbTask.task_id, DbTask.dead_letter).where(
+                DbTask.task_id.in_(parent_ids), DbTask.namespace == namespace
+            )
+        ).all()
+        for parent_id, dead_letter in parents:
+            if dead_letter:
+                raise db.DB_WRONG_STATUS(f"Upstream task '{parent_id}' is dead-lettered")
+        pending = [parent_id for parent_id, _ in parents]
+        upstream = {}
+        for parent_id in parent_ids:
+            if parent_id in pending:
+                continue
+            archive = session.exec(
+                select(DbArchive)
+                .where(
+                    DbArchive.task_id == parent_id,
+                    DbArchive.namespace == namespace,
+                    DbArchive.status == work_status.SUCCEEDED,
+                )
+                .order_by(DbArchive.archived_at.desc())
+                .limit(1)
+            ).one_or_none()
+            if not archive:
+                raise db.DB_ITEM_NOT_FOUND(f"Upstream task '{parent_id}' does not exist")
+            if archive.memo_of:
+                archive = session.get(DbArchive, archive.memo_of) or archive
+            reports = archive.reports["reports"]
+            upstream[parent_id] = reports[-1]["details"] if reports else None
+        return pending, upstream
+
+    @staticmethod
+    def _release_dependents(task_id: str, details: Dict | None, session: Session) -> None:
+        """
+        Count the successful task off the tasks waiting for it and hand them its
+        final report details, as part of the caller's transaction.
+        """
+        waiting = select(DbTaskDep.task_id).where(DbTaskDep.depends_on == task_id)
+        session.execute(
+            update(DbTask)
+            .where(DbTask.task_id.in_(waiting))
+            .values(
+                pending_deps=DbTask.pending_deps - 1,
+                released_at=case(
+                    (DbTask.pending_deps == 1, datetime.now()), else_=DbTask.released_at
+                ),
+            )
+        )
+        # the rows are locked by the update, merge into their current upstream
+        dependents = session.exec(
+            select(DbTask)
+            .where(DbTask.task_id.in_(waiting))
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        ).all()
+        for dependent in dependents:
+            dependent.upstream = {**(dependent.upstream or {}), task_id: details}
+        session.execute(delete(DbTaskDep).where(DbTaskDep.depends_on == task_id))
+
+    @staticmethod
+    def _dead_letter_dependents(task_id: str, session: Session) -> None:
+        """
+        Dead-letter the tasks waiting, directly or through other tasks, for a
+        dead-lettered task, without committing. They keep their dependencies
+        and are requeued together with the upstream task.
+        """
+        parent_ids = [task_id]
+        while parent_ids:
+            dependents = session.exec(
+                select(DbTask)
+                .join(DbTaskDep, DbTaskDep.task_id == DbTask.task_id)
+                .where(DbTaskDep.depends_on.in_(parent_ids), DbTask.dead_letter == False)
+            ).all()
+            for dependent in dependents:
+                dependent.dead_letter = True
+                dependent.eligible_at = None
+                dependent.dedup_key = None
+                StatsAccess.record_queue_event(dependent.needs_hash, session, departures=1)
+            parent_ids = [dependent.task_id for dependent in dependents]
+            MatchAccess.remove_tasks(parent_ids, session)
+
+    @staticmethod
+    def _requeue_dependents(task_id: str, session: Session) -> None:
+        """
+        Requeue the tasks that were dead-lettered with an upstream task,
+        without committing. Only they can be dead-lettered while waiting.
+        """
+        parent_ids = [task_id]
+        while parent_ids:
+            dependents = session.exec(
+                select(DbTask)
+                .join(DbTaskDep, DbTaskDep.task_id == DbTask.task_id)
+                .where(
+                    DbTaskDep.depends_on.in_(parent_ids),
+                    DbTask.dead_letter == True,
+                    DbTask.pending_deps > 0,
+                )
+            ).all()
+            for dependent in dependents:
+                dependent.dead_letter = False
+                StatsAccess.record_queue_event(dependent.needs_hash, session, arrivals=1)
+                MatchAccess.add_task(dependent.task_id, dependent.task_needs, session)
+            parent_ids = [dependent.task_id for dependent in dependents]
+
+    @staticmethod
+    def _get_recent_success(
+        needs_hash: str, namespace: str, session: Session
+    ) -> DbArchive | None:
+        cutoff = datetime.now() - timedelta(seconds=TASK_DEDUP_WINDOW)
+        return session.exec(
+            select(DbArchive)
+            .where(
+                DbArchive.needs_hash == needs_hash,
+                DbArchive.namespace == namespace,
+                DbArchive.archived_at >= cutoff,
+                DbArchive.status == work_status.SUCCEEDED,
+            )
+            .order_by(DbArchive.archived_at.desc())
+            .limit(1)
+        ).first()
 
     @staticmethod
     def delete_task(task_id: str, session: Session) -> Outcome:
@@ -141,21 +600,35 @@ class TaskAccess:
         ).one_or_none()
         if not task:
             raise db.DB_ITEM_NOT_FOUND(f"Task '{task_id}' does not exist")
+        dependent = session.exec(
+            select(DbTaskDep.task_id).where(DbTaskDep.depends_on == task_id).limit(1)
+        ).first()
+        if dependent:
+            raise db.DB_ITEM_REFERENCED(
+                f"Task '{task_id}' is an upstream task of task '{dependent}'"
+            )
+        session.execute(delete(DbTaskDep).where(DbTaskDep.task_id == task_id))
         session.delete(task)
+        MatchAccess.remove_tasks([task_id], session)
         session.commit()
         return Outcome(message=f"Task {task.task_id} deleted successfully")
 
     @staticmethod
     def delete_all_tasks(session: Session) -> Outcome:
         items = session.exec(select(DbTask)).all()
+        session.execute(delete(DbTaskDep))
         for item in items:
             session.delete(item)
+        session.execute(delete(DbNeedIndex))
         session.commit()
         return Outcome(message=f"{len(items)} tasks were deleted")
 
     @staticmethod
-    def get_all_tasks(session: Session) -> list[DbTask]:
-        result = session.exec(select(DbTask))
+    def get_all_tasks(session: Session, namespace: str | None = None) -> list[DbTask]:
+        stmt = select(DbTask)
+        if namespace is not None:
+            stmt = stmt.where(DbTask.namespace == namespace)
+        result = session.exec(stmt)
         return result.all()
 
     @staticmethod
@@ -167,73 +640,417 @@ class TaskAccess:
         return task
 
     @staticmethod
-    def get_available_tasks(session: Session) -> list[DbTask]:
+    def get_available_tasks(
+        session: Session, locality: str | None = None, namespace: str | None = None
+    ) -> list[DbTask]:
+        """Available tasks, tasks co-located with the given locality first"""
+        order = [DbTask.created_at.desc()]
+        if locality is not None:
+            order.insert(0, (DbTask.locality == locality).desc())
         tasks_stmt = (
             select(DbTask)
-            .where(DbTask.work_id == None)
-            .order_by(DbTask.created_at.desc())
+            .where(DbTask.work_id == None, TaskAccess.is_eligible())
+            .order_by(*order)
         )
+        if namespace is not None:
+            tasks_stmt = tasks_stmt.where(DbTask.namespace == namespace)
         tasks = session.exec(tasks_stmt).all()
         if not tasks:
             return []
         return tasks
 
 
+    @staticmethod
+    @untraced
+    def is_eligible():
+        """
+        Condition for tasks that are not dead-lettered, scheduled, waiting to
+        be retried or waiting for upstream tasks. Tasks become due when
+        promote_due_tasks clears their eligible_at, so that the condition is
+        covered by the ix_tasks_ready partial index.
+        """
+        return (
+            (DbTask.dead_letter == False)
+            & (DbTask.pending_deps == 0)
+            & (DbTask.eligible_at == None)
+        )
+
+    @staticmethod
+    def promote_due_tasks(session: Session) -> int:
+        """
+        Make the scheduled and backed off tasks whose time has come available
+        with one UPDATE, which also changes the ETag of the task listings.
+        When nothing is due this is a single probe of the eligible_at index.
+        """
+        now = datetime.now()
+        next_due = session.exec(select(func.min(DbTask.eligible_at))).one()
+        if next_due is None or next_due > now:
+            return 0
+        result = session.execute(
+            update(DbTask)
+            .where(DbTask.eligible_at <= now)
+            .values(eligible_at=None, released_at=DbTask.eligible_at)
+        )
+        session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def get_dead_letter_tasks(
+        session: Session, namespace: str | None = None
+    ) -> list[DbTask]:
+        stmt = select(DbTask).where(DbTask.dead_letter == True)
+        if namespace is not None:
+            stmt = stmt.where(DbTask.namespace == namespace)
+        return session.exec(stmt).all()
+
+    @staticmethod
+    def requeue_task(task_id: str, session: Session) -> Outcome:
+        task = TaskAccess.get_task(task_id, session)
+        if task.work_id is not None:
+            return Outcome(
+                message=f"Task '{task_id}' is assigned to work item '{task.work_id}'",
+                success=False,
+            )
+        dead_parent = session.exec(
+            select(DbTaskDep.depends_on)
+            .join(DbTask, DbTask.task_id == DbTaskDep.depends_on)
+            .where(DbTaskDep.task_id == task_id, DbTask.dead_letter == True)
+            .limit(1)
+        ).first()
+        if dead_parent:
+            return Outcome(
+                message=f"Task '{task_id}' waits for dead-lettered task '{dead_parent}', requeue that one",
+                success=False,
+            )
+        if task.dead_letter:
+            StatsAccess.record_queue_event(task.needs_hash, session, arrivals=1)
+            TaskAccess._requeue_dependents(task_id, session)
+        task.attempts = 0
+        task.eligible_at = None
+        task.released_at = datetime.now()
+        task.dead_letter = False
+        MatchAccess.add_task(task.task_id, task.task_needs, session)
+        session.commit()
+        return Outcome(message=f"Task {task_id} requeued")
+
+    @staticmethod
+    def _record_failure(task: DbTask, session: Session) -> None:
+        """
+        Count a failed attempt and either schedule the retry with exponential
+        backoff or dead-letter the task, without committing. A dead-lettered
+        task gives up its dedup key so that identical tasks can be created
+        again, the key stays cleared if the task is requeued.
+        """
+        task.attempts += 1
+        if task.attempts >= (task.max_attempts or TASK_MAX_ATTEMPTS):
+            task.dead_letter = True
+            task.eligible_at = None
+            task.dedup_key = None
+            TaskAccess._dead_letter_dependents(task.task_id, session)
+            return
+        backoff = RETRY_BACKOFF_BASE * 2 ** (task.attempts - 1)
+        task.eligible_at = datetime.now() + timedelta(
+            seconds=min(backoff, RETRY_BACKOFF_MAX)
+        )
+        MatchAccess.add_task(task.task_id, task.task_needs, session)
+
+
 # ----------------- Work functions -----------------
 
+# attempts at a guarded work update before giving up on concurrent writers
+WORK_UPDATE_RETRIES = 3
 
+
+@traced_class()
 class WorkAccess:
 
     @staticmethod
-    def create_work(work_create: WorkCreate, session: Session) -> Outcome:
+    def create_work(
+        work_create: WorkCreate, session: Session, namespace: str | None = None
+    ) -> Outcome:
         tool = session.exec(
             select(DbTool).where(DbTool.tool_id == work_create.tool_id)
         ).one_or_none()
-        if not tool:
+        if not tool or namespace not in (None, tool.namespace):
             raise db.DB_ITEM_NOT_FOUND(f"Tool '{work_create.tool_id}' does not exist")
         task = session.exec(
             select(DbTask).where(DbTask.task_id == work_create.task_id)
         ).one_or_none()
-        if not task:
+        if not task or task.namespace != tool.namespace:
             raise db.DB_ITEM_NOT_FOUND(f"Task '{work_create.task_id}' does not exist")
+        if task.work_id is not None:
+            raise db.DB_ITEM_REFERENCED(
+                f"Task '{task.task_id}' is already assigned to work item '{task.work_id}'"
+            )
+        if task.dead_letter:
+            raise db.DB_WRONG_STATUS(f"Task '{task.task_id}' is dead-lettered")
+        if task.pending_deps:
+            raise db.DB_WRONG_STATUS(
+                f"Task '{task.task_id}' is waiting for {task.pending_deps} upstream tasks"
+            )
+        if task.eligible_at is not None:
+            raise db.DB_WRONG_STATUS(
+                f"Task '{task.task_id}' is not due before {task.eligible_at}"
+            )
+        if NamespaceAccess.is_over_quota(tool.namespace, "work", session):
+            raise db.DB_QUOTA_EXCEEDED(
+                f"Namespace '{tool.namespace}' has reached its quota of active work items"
+            )
+        claimed = session.execute(
+            update(DbTool)
+            .where(DbTool.tool_id == tool.tool_id, DbTool.free_slots > 0)
+            .values(free_slots=DbTool.free_slots - 1)
+        )
+        if claimed.rowcount == 0:
+            raise db.DB_ITEM_REFERENCED(f"Tool '{tool.tool_id}' has no free work slots")
 
-        work: DbWork = DbWork()
+        work: DbWork = DbWork(namespace=tool.namespace)
         work.tool = tool
         work.task = task
         session.add(work)
+        MatchAccess.sync_tool(tool, session)
+        MatchAccess.remove_tasks([task.task_id], session)
         session.commit()
         return Outcome(
             message=f"Work item {work.work_id} for tool {work_create.tool_id} and task {work_create.task_id} created successfully"
         )
 
+    @staticmethod
+    def create_work_batch(
+        pairs: list[WorkCreate], session: Session, namespace: str | None = None
+    ) -> BatchOutcome:
+        tool_ids = {pair.tool_id for pair in pairs}
+        task_ids = {pair.task_id for pair in pairs}
+        # a tool can only take work like the tools of get_available_tools
+        available = and_(
+            DbTool.enabled == True, DbTool.ready_since != None, ToolAccess.is_live()
+        ).label("available")
+        tools_stmt = select(
+            DbTool.tool_id, DbTool.free_slots, DbTool.namespace, available
+        ).where(DbTool.tool_id.in_(tool_ids))
+        tasks_stmt = select(DbTask.task_id, DbTask.work_id, DbTask.namespace).where(
+            DbTask.task_id.in_(task_ids), TaskAccess.is_eligible()
+        )
+        if namespace is not None:
+            tools_stmt = tools_stmt.where(DbTool.namespace == namespace)
+            tasks_stmt = tasks_stmt.where(DbTask.namespace == namespace)
+        tool_rows = session.exec(tools_stmt).all()
+        task_rows = session.exec(tasks_stmt).all()
+        tools = {
+            tool_id: free_slots if is_available else None
+            for tool_id, free_slots, _, is_available in tool_rows
+        }
+        tasks = {task_id: work_id for task_id, work_id, _ in task_rows}
+        tool_namespaces = {tool_id: space for tool_id, _, space, _ in tool_rows}
+        task_namespaces = {task_id: space for task_id, _, space in task_rows}
+        free_work: dict[str, int | None] = {}
+
+        accepted: list[WorkCreate] = []
+        conflicts: list[WorkConflict] = []
+        for pair in pairs:
+            reason = WorkAccess._get_pair_conflict(pair, tools, tasks)
+            if not reason:
+                space = tool_namespaces[pair.tool_id]
+                if space not in free_work:
+                    free_work[space] = NamespaceAccess.get_free_work(space, session)
+                reason = WorkAccess._get_namespace_conflict(
+                    pair, space, task_namespaces[pair.task_id], free_work[space]
+                )
+            if reason:
+                conflicts.append(WorkConflict(**pair.model_dump(), reason=reason))
+                continue
+            accepted.append(pair)
+            # the slot, task and quota are taken for the rest of the batch
+            tools[pair.tool_id] -= 1
+            tasks[pair.task_id] = -1
+            if free_work[space] is not None:
+                free_work[space] -= 1
+
+        work_ids = []
+        if accepted:
+            work_ids = WorkAccess._insert_work_batch(accepted, tool_namespaces, session)
+        return BatchOutcome(
+            message=f"{len(work_ids)} work items created, {len(conflicts)} conflicts",
+            success=not conflicts,
+            work_ids=work_ids,
+            conflicts=conflicts,
+        )
+
+    @staticmethod
+    def _get_pair_conflict(pair: WorkCreate, tools: dict, tasks: dict) -> str | None:
+        if pair.tool_id not in tools:
+            return f"Tool '{pair.tool_id}' does not exist"
+        if tools[pair.tool_id] is None:
+            return f"Tool '{pair.tool_id}' is not available (disabled, not ready or not live)"
+        if tools[pair.tool_id] <= 0:
+            return f"Tool '{pair.tool_id}' has no free work slots"
+        if pair.task_id not in tasks:
+            return f"Task '{pair.task_id}' does not exist or is not eligible (dead-lettered, not due yet or waiting for upstream tasks)"
+        if tasks[pair.task_id] is not None:
+            return f"Task '{pair.task_id}' is already assigned"
+        return None
+
+    @staticmethod
+    def _get_namespace_conflict(
+        pair: WorkCreate, tool_namespace: str, task_namespace: str, free_work: int | None
+    ) -> str | None:
+        if tool_namespace != task_namespace:
+            return f"Tool '{pair.tool_id}' and task '{pair.task_id}' are in different namespaces"
+        if free_work is not None and free_work <= 0:
+            return f"Namespace '{tool_namespace}' has reached its quota of active work items"
+        return None
+
+    @staticmethod
+    def assign_work(
+        session: Session, limit: int | None = None, namespace: str | None = None
+    ) -> BatchOutcome:
+        """
+        Pair available tasks, oldest first, with compatible tools of their
+        namespace and create the work items as one batch, within the namespace
+        quotas. A task with a locality hint goes to a tool at the same locality;
+        it only falls back to another tool once it has waited
+        LOCALITY_FALLBACK_DELAY seconds since it was released (or created).
+        """
+        tasks_stmt = (
+            select(DbTask)
+            .where(DbTask.work_id == None, TaskAccess.is_eligible())
+            .order_by(DbTask.created_at)
+            .limit(limit)
+        )
+        if namespace is not None:
+            tasks_stmt = tasks_stmt.where(DbTask.namespace == namespace)
+        tasks = session.exec(tasks_stmt).all()
+        fallback_before = datetime.now() - timedelta(seconds=LOCALITY_FALLBACK_DELAY)
+        compatible: dict[tuple[str, str], list[DbTool]] = {}
+        free_slots: dict[str, int] = {}
+        free_work: dict[str, int | None] = {}
+        pairs: list[WorkCreate] = []
+        for task in tasks:
+            if task.namespace not in free_work:
+                free_work[task.namespace] = NamespaceAccess.get_free_work(
+                    task.namespace, session
+                )
+            if free_work[task.namespace] == 0:
+                continue
+            match_key = (task.namespace, task.needs_hash)
+            if match_key not in compatible:
+                tools = MatchAccess.get_compatible_tools(
+                    task.task_needs, session, task.namespace
+                )
+                compatible[match_key] = tools
+                free_slots.update((tool.tool_id, tool.free_slots) for tool in tools)
+            candidates = [
+                tool for tool in compatible[match_key] if free_slots[tool.tool_id] > 0
+            ]
+            local = [tool for tool in candidates if tool.locality == task.locality]
+            if task.locality is not None and local:
+                candidates = local
+            elif (
+                task.locality is not None
+                and (task.released_at or task.created_at) > fallback_before
+            ):
+                continue
+            if not candidates:
+                continue
+            tool = max(candidates, key=lambda tool: free_slots[tool.tool_id])
+            free_slots[tool.tool_id] -= 1
+            if free_work[task.namespace] is not None:
+                free_work[task.namespace] -= 1
+            pairs.append(WorkCreate(task_id=task.task_id, tool_id=tool.tool_id))
+        if not pairs:
+            return BatchOutcome(message="No work could be assigned", work_ids=[])
+        return WorkAccess.create_work_batch(pairs, session)
+
+    @staticmethod
+    def _insert_work_batch(
+        pairs: list[WorkCreate], namespaces: dict[str, str], session: Session
+    ) -> list[int]:
+        """
+        Insert the work rows for all pairs in a single statement, then claim
+        the tool slots and bind the tasks with one UPDATE per table.
+        """
+        rows = [
+            {
+                "status": work_status.NEW,
+                "completed": False,
+                "version": 0,
+                "namespace": namespaces[pair.tool_id],
+                "tool_id": pair.tool_id,
+            }
+            for pair in pairs
+        ]
+        work_ids = (
+            session.execute(
+                insert(DbWork.__table__).returning(
+                    DbWork.work_id, sort_by_parameter_order=True
+                ),
+                rows,
+            )
+            .scalars()
+            .all()
+        )
+        slots = Counter(pair.tool_id for pair in pairs)
+        task_map = {pair.task_id: work_id for pair, work_id in zip(pairs, work_ids)}
+        claimed = case(slots, value=DbTool.tool_id)
+        tools_result = session.execute(
+            update(DbTool.__table__)
+            .where(DbTool.tool_id.in_(slots), DbTool.free_slots >= claimed)
+            .values(free_slots=DbTool.free_slots - claimed)
+        )
+        tasks_result = session.execute(
+            update(DbTask.__table__)
+            .where(DbTask.task_id.in_(task_map), DbTask.work_id == None)
+            .values(work_id=case(task_map, value=DbTask.task_id))
+        )
+        if tools_result.rowcount != len(slots) or tasks_result.rowcount != len(pairs):
+            session.rollback()
+            raise db.DB_ITEM_REFERENCED(
+                "Tools or tasks were assigned concurrently, no work was created"
+            )
+        MatchAccess.remove_full_tools(list(slots), session)
+        MatchAccess.remove_tasks(list(task_map), session)
+        session.commit()
+        return work_ids
+
     @staticmethod
     def delete_work(work_id: int, session: Session) -> Outcome:
         return Outcome(message=f"Not implemented yet", success=False)
 
     @staticmethod
-    def get_all_work(session: Session) -> list[DbWork]:
-        raw = session.exec(select(DbWork)).all()
+    def get_all_work(session: Session, namespace: str | None = None) -> list[DbWork]:
+        raw = session.exec(WorkAccess._scoped(select(DbWork), namespace)).all()
         return [DbWork.model_validate(item) for item in raw]
 
     @staticmethod
-    def get_all_completed_work(session: Session) -> list[DbWork]:
-        raw = session.exec(select(DbWork).where(DbWork.completed == True)).all()
+    def get_all_completed_work(
+        session: Session, namespace: str | None = None
+    ) -> list[DbWork]:
+        stmt = select(DbWork).where(DbWork.completed == True)
+        raw = session.exec(WorkAccess._scoped(stmt, namespace)).all()
         return [DbWork.model_validate(item) for item in raw]
 
     @staticmethod
-    def get_all_successful_work(session: Session) -> list[DbWork]:
-        raw = session.exec(
-            select(DbWork).where(DbWork.status == work_status.SUCCEEDED)
-        ).all()
+    def get_all_successful_work(
+        session: Session, namespace: str | None = None
+    ) -> list[DbWork]:
+        stmt = select(DbWork).where(DbWork.status == work_status.SUCCEEDED)
+        raw = session.exec(WorkAccess._scoped(stmt, namespace)).all()
         return [DbWork.model_validate(item) for item in raw]
 
     @staticmethod
-    def get_all_failed_work(session: Session) -> list[DbWork]:
-        raw = session.exec(
-            select(DbWork).where(DbWork.status == work_status.FAILED)
-        ).all()
+    def get_all_failed_work(
+        session: Session, namespace: str | None = None
+    ) -> list[DbWork]:
+        stmt = select(DbWork).where(DbWork.status == work_status.FAILED)
+        raw = session.exec(WorkAccess._scoped(stmt, namespace)).all()
         return [DbWork.model_validate(item) for item in raw]
 
+    @staticmethod
+    def _scoped(stmt, namespace: str | None):
+        if namespace is None:
+            return stmt
+        return stmt.where(DbWork.namespace == namespace)
+
     @staticmethod
     def get_work(work_id: int, session: Session) -> DbWork:
         result = session.exec(select(DbWork).where(DbWork.work_id == work_id))
@@ -242,6 +1059,13 @@ class WorkAccess:
             raise db.DB_ITEM_NOT_FOUND(f"Work '{work_id}' does not exist")
         return work
 
+    @staticmethod
+    def is_active(work_id: int, session: Session) -> bool:
+        """Whether the work item exists, i.e. it has not been archived"""
+        return session.exec(
+            select(DbWork.work_id).where(DbWork.work_id == work_id)
+        ).first() is not None
+
     @staticmethod
     def work_succeeded(work_id: int, session: Session) -> Outcome:
         outcome = WorkAccess._set_work_completed(work_id, True, session)
@@ -254,24 +1078,64 @@ class WorkAccess:
 
     @staticmethod
     def _set_work_completed(work_id: int, success: bool, session: Session) -> Outcome:
+        status = work_status.SUCCEEDED if success else work_status.FAILED
         work = session.exec(
             select(DbWork).where(DbWork.work_id == work_id)
         ).one_or_none()
         if not work:
-            raise db.DB_ITEM_NOT_FOUND(f"Work '{work_id}' does not exist")
-
-        work.status = work_status.SUCCEEDED if success else work_status.FAILED
-        work.completed = True
+            return WorkAccess._get_archived_outcome(work_id, status, session)
 
-        session.commit()
-        session.refresh(work)
+        # a work item whose final report already carried the status completes too
+        sources = work_sources(status) + [status]
+        if work.status not in sources:
+            raise db.DB_WRONG_STATUS(
+                f"Work item {work_id} cannot be completed as {status}, it is {work.status}"
+            )
+        claimed = session.execute(
+            update(DbWork)
+            .where(
+                DbWork.work_id == work_id,
+                DbWork.status.in_(sources),
+                DbWork.version == work.version,
+            )
+            .values(status=status, completed=True, version=DbWork.version + 1)
+        )
+        if claimed.rowcount == 0:
+            # another writer completed or changed the work item first
+            session.rollback()
+            if session.get(DbWork, work_id) is None:
+                return WorkAccess._get_archived_outcome(work_id, status, session)
+            raise db.DB_WRONG_STATUS(f"Work item {work_id} was changed concurrently")
+        StatsAccess.record_completion(work, session)
+        if TASK_MEMOIZE and success:
+            MemoAccess.remember(work, session)
 
-        work.tool.work_id = None
-        work.tool.ready_since = None
+        # a tool left without active work has to declare itself ready again
+        session.execute(
+            update(DbTool)
+            .where(DbTool.tool_id == work.tool.tool_id)
+            .values(
+                free_slots=DbTool.free_slots + 1,
+                ready_since=case(
+                    (DbTool.free_slots + 1 >= DbTool.capacity, None),
+                    else_=DbTool.ready_since,
+                ),
+            )
+        )
+        session.refresh(work.tool)
+        MatchAccess.sync_tool(work.tool, session)
 
         work.task.work_id = None
         if work.status == work_status.SUCCEEDED:
+            final = max(work.reports, key=lambda report: report.id, default=None)
+            TaskAccess._release_dependents(
+                work.task.task_id, final.details if final else None, session
+            )
             session.delete(work.task)
+        else:
+            TaskAccess._record_failure(work.task, session)
+        if work.status == work_status.SUCCEEDED or work.task.dead_letter:
+            StatsAccess.record_queue_event(work.task.needs_hash, session, departures=1)
 
         work_archive = DbArchive().from_work(work)
         session.add(work_archive)
@@ -284,21 +1148,58 @@ class WorkAccess:
             message=f"Work item {work_id} completed and archived successfully"
         )
 
+    @staticmethod
+    def _get_archived_outcome(work_id: int, status: str, session: Session) -> Outcome:
+        """
+        Treat a repeated completion of work that was already archived with the
+        same status as a no-op so that client retries do not fail.
+        """
+        archive = session.get(DbArchive, work_id)
+        if not archive:
+            raise db.DB_ITEM_NOT_FOUND(f"Work '{work_id}' does not exist")
+        if archive.status != status:
+            raise db.DB_WRONG_STATUS(
+                f"Work item {work_id} was already archived as {archive.status}"
+            )
+        return Outcome(message=f"Work item {work_id} was already archived")
+
     @staticmethod
     def create_work_report(
         work_id: int, report_create: ReportCreate, session: Session
     ) -> Outcome:
         status = report_create.status
-        details = report_create.details
-        work = session.exec(
-            select(DbWork).where(DbWork.work_id == work_id)
-        ).one_or_none()
-        if not work:
-            raise db.DB_ITEM_NOT_FOUND(f"Work '{work_id}' does not exist")
+        if status not in work_transitions:
+            raise db.DB_WRONG_STATUS(f"Unknown work status '{status}'")
+        for _ in range(WORK_UPDATE_RETRIES):
+            work = session.exec(
+                select(DbWork.status, DbWork.version).where(DbWork.work_id == work_id)
+            ).one_or_none()
+            if not work:
+                raise db.DB_ITEM_NOT_FOUND(f"Work '{work_id}' does not exist")
+            if status not in work_transitions[work.status]:
+                raise db.DB_WRONG_STATUS(
+                    f"Work item {work_id} cannot go from {work.status} to {status}"
+                )
+            updated = session.execute(
+                update(DbWork)
+                .where(
+                    DbWork.work_id == work_id,
+                    DbWork.status.in_(work_sources(status)),
+                    DbWork.version == work.version,
+                )
+                .values(
+                    status=status,
+                    completed=not work_transitions[status],
+                    version=DbWork.version + 1,
+                )
+            )
+            if updated.rowcount:
+                break
+            session.rollback()
+        else:
+            raise db.DB_WRONG_STATUS(f"Work item {work_id} was changed concurrently")
+        details = BlobAccess.offload(report_create.details, session)
         report = DbReport(work_id=work_id, status=status, details=details)
-        work.status = status
-        if work.status == work_status.SUCCEEDED or work.status == work_status.FAILED:
-            work.completed = True
         session.add(report)
         session.commit()
         return Outcome(
@@ -306,9 +1207,20 @@ class WorkAccess:
         )
 
     @staticmethod
-    def get_work_reports(work_id: int, session: Session) -> list[DbReport]:
-        result = session.exec(select(DbReport).where(DbReport.work_id == work_id)).all()
-        return result
+    def get_work_reports(
+        work_id: int,
+        session: Session,
+        since_id: int | None = None,
+        after: datetime | None = None,
+        limit: int | None = None,
+    ) -> list[DbReport]:
+        stmt = select(DbReport).where(DbReport.work_id == work_id)
+        if since_id is not None:
+            stmt = stmt.where(DbReport.id > since_id)
+        if after is not None:
+            stmt = stmt.where(DbReport.created_at > after)
+        stmt = stmt.order_by(DbReport.id).limit(limit)
+        return session.exec(stmt).all()
 
     #
     @staticmethod
@@ -317,6 +1229,7 @@ class WorkAccess:
         if items:
             for item in items:
                 session.delete(item)
+            session.execute(update(DbTool).values(free_slots=DbTool.capacity))
             session.commit()
             return Outcome(message=f"{len(items)} work items were deleted")
         else:
@@ -334,11 +1247,649 @@ class WorkAccess:
             return Outcome(message="No reports found", success=False)
 
 
+# ----------------- Matching functions -----------------
+
+
+@traced_class()
+class MatchAccess:
+    """
+    Maintains the skill and need indexes used to match tasks to tools.
+    The index functions do not commit, they are part of the caller's transaction.
+    """
+
+    @staticmethod
+    def sync_tool(tool: DbTool, session: Session) -> None:
+        MatchAccess.remove_tools([tool.tool_id], session)
+        if tool.enabled and tool.ready_since and tool.free_slots > 0:
+            session.add_all(
+                DbSkillIndex(skill_key=key, tool_id=tool.tool_id)
+                for key in skill_keys(tool.tool_skills)
+            )
+
+    @staticmethod
+    def sync_tools(tool_ids: list[str], session: Session) -> None:
+        """Re-index many tools with one delete and one insert"""
+        MatchAccess.remove_tools(tool_ids, session)
+        tools = session.exec(
+            select(DbTool.tool_id, DbTool.tool_skills).where(
+                DbTool.tool_id.in_(tool_ids),
+                DbTool.enabled == True,
+                DbTool.ready_since != None,
+                DbTool.free_slots > 0,
+            )
+        ).all()
+        rows = [
+            {"skill_key": key, "tool_id": tool_id}
+            for tool_id, tool_skills in tools
+            for key in skill_keys(tool_skills)
+        ]
+        if rows:
+            session.execute(insert(DbSkillIndex), rows)
+
+    @staticmethod
+    def remove_tools(tool_ids: list[str], session: Session) -> None:
+        session.execute(delete(DbSkillIndex).where(DbSkillIndex.tool_id.in_(tool_ids)))
+
+    @staticmethod
+    def remove_full_tools(tool_ids: list[str], session: Session) -> None:
+        full_tools = select(DbTool.tool_id).where(
+            DbTool.tool_id.in_(tool_ids), DbTool.free_slots <= 0
+        )
+        session.execute(delete(DbSkillIndex).where(DbSkillIndex.tool_id.in_(full_tools)))
+
+    @staticmethod
+    def add_task(task_id: str, task_needs: Dict, session: Session) -> None:
+        MatchAccess.remove_tasks([task_id], session)
+        keys = skill_keys(task_needs) or [ANY_KEY]
+        session.add_all(
+            DbNeedIndex(need_key=key, task_id=task_id, need_count=len(keys))
+            for key in keys
+        )
+
+    @staticmethod
+    def remove_tasks(task_ids: list[str], session: Session) -> None:
+        session.execute(delete(DbNeedIndex).where(DbNeedIndex.task_id.in_(task_ids)))
+
+    @staticmethod
+    def get_compatible_tools(
+        task_needs: Dict, session: Session, namespace: str | None = None
+    ) -> list[DbTool]:
+        keys = skill_keys(task_needs)
+        if not keys:
+            return ToolAccess.get_available_tools(session, namespace=namespace)
+        matches = (
+            select(DbSkillIndex.tool_id)
+            .where(DbSkillIndex.skill_key.in_(keys))
+            .group_by(DbSkillIndex.tool_id)
+            .having(func.count() == len(keys))
+        )
+        tools_stmt = (
+            select(DbTool)
+            .where(DbTool.tool_id.in_(matches), ToolAccess.is_live())
+            .order_by(DbTool.ready_since.desc())
+        )
+        if namespace is not None:
+            tools_stmt = tools_stmt.where(DbTool.namespace == namespace)
+        return session.exec(tools_stmt).all()
+
+    @staticmethod
+    def get_compatible_tasks(tool_id: str, session: Session) -> list[DbTask]:
+        tool = ToolAccess.get_tool(tool_id, session)
+        keys = skill_keys(tool.tool_skills) + [ANY_KEY]
+        matches = (
+            select(DbNeedIndex.task_id)
+            .where(DbNeedIndex.need_key.in_(keys))
+            .group_by(DbNeedIndex.task_id)
+            .having(func.count() == func.max(DbNeedIndex.need_count))
+        )
+        tasks_stmt = (
+            select(DbTask)
+            .where(
+                DbTask.task_id.in_(matches),
+                DbTask.namespace == tool.namespace,
+                TaskAccess.is_eligible(),
+            )
+            .order_by(DbTask.created_at.desc())
+        )
+        return session.exec(tasks_stmt).all()
+
+    @staticmethod
+    def rebuild_index(session: Session) -> Outcome:
+        """
+        Rebuild the matching index, first filling in the signatures of rows
+        written before their columns existed (see add_missing_columns).
+        """
+        tools = session.exec(select(DbTool).where(DbTool.skills_signature == None)).all()
+        for tool in tools:
+            tool.skills_signature = doc_signature(tool.tool_skills)
+            tool.locality = ToolAccess.get_locality(tool.tool_skills)
+        tasks = session.exec(select(DbTask).where(DbTask.needs_hash == None)).all()
+        for task in tasks:
+            task.needs_hash = doc_signature(task.task_needs)
+        archived = session.exec(select(DbArchive).where(DbArchive.needs_hash == None)).all()
+        for archive in archived:
+            archive.needs_hash = doc_signature(archive.task_needs)
+        session.flush()
+        session.execute(delete(DbSkillIndex))
+        session.execute(delete(DbNeedIndex))
+        for tool in ToolAccess.get_available_tools(session):
+            MatchAccess.sync_tool(tool, session)
+        # scheduled and backed off tasks stay indexed until they are due
+        tasks = session.exec(
+            select(DbTask).where(DbTask.work_id == None, DbTask.dead_letter == False)
+        ).all()
+        for task in tasks:
+            MatchAccess.add_task(task.task_id, task.task_needs, session)
+        session.commit()
+        return Outcome(message="Matching index rebuilt")
+
+
+# ----------------- Namespace functions -----------------
+
+
+@traced_class()
+class NamespaceAccess:
+    """
+    Quotas per namespace. The counts use the indexes that lead with the
+    namespace, so they do not grow with the other namespaces. Concurrent
+    requests may overshoot a quota by the items they create at the same time.
+    """
+
+    @staticmethod
+    @untraced
+    def get_quota(namespace: str, kind: str) -> int | None:
+        """Get the "tasks" or "work" quota of the namespace, None when unlimited"""
+        quotas = NAMESPACE_QUOTAS.get(namespace, NAMESPACE_QUOTAS.get("*", {}))
+        return quotas.get(kind) or None
+
+    @staticmethod
+    def count_queued_tasks(namespace: str, session: Session) -> int:
+        return session.exec(
+            select(func.count())
+            .select_from(DbTask)
+            .where(DbTask.namespace == namespace, DbTask.work_id == None)
+        ).one()
+
+    @staticmethod
+    def count_active_work(namespace: str, session: Session) -> int:
+        return session.exec(
+            select(func.count()).select_from(DbWork).where(DbWork.namespace == namespace)
+        ).one()
+
+    @staticmethod
+    def is_over_quota(namespace: str, kind: str, session: Session) -> bool:
+        """Whether the namespace may not get another queued task or work item"""
+        quota = NamespaceAccess.get_quota(namespace, kind)
+        if quota is None:
+            return False
+        if kind == "tasks":
+            return NamespaceAccess.count_queued_tasks(namespace, session) >= quota
+        return NamespaceAccess.count_active_work(namespace, session) >= quota
+
+    @staticmethod
+    def get_free_work(namespace: str, session: Session) -> int | None:
+        """Get how many more work items the namespace may have, None when unlimited"""
+        quota = NamespaceAccess.get_quota(namespace, "work")
+        if quota is None:
+            return None
+        return max(quota - NamespaceAccess.count_active_work(namespace, session), 0)
+
+    @staticmethod
+    def get_usage(namespace: str, session: Session) -> NamespaceUsage:
+        tools = session.exec(
+            select(func.count()).select_from(DbTool).where(DbTool.namespace == namespace)
+        ).one()
+        return NamespaceUsage(
+            namespace=namespace,
+            tools=tools,
+            queued_tasks=NamespaceAccess.count_queued_tasks(namespace, session),
+            active_work=NamespaceAccess.count_active_work(namespace, session),
+            task_quota=NamespaceAccess.get_quota(namespace, "tasks"),
+            work_quota=NamespaceAccess.get_quota(namespace, "work"),
+        )
+
+
+# ----------------- Request key functions -----------------
+
+
+@traced_class()
+class RequestKeyAccess:
+    @staticmethod
+    def get_response(request_key: str, route: str, session: Session) -> Dict | None:
+        cutoff = datetime.now() - timedelta(seconds=IDEMPOTENCY_TTL)
+        item = session.exec(
+            select(DbRequestKey).where(
+                DbRequestKey.request_key == request_key,
+                DbRequestKey.route == route,
+                DbRequestKey.created_at >= cutoff,
+            )
+        ).one_or_none()
+        return item.response if item else None
+
+    @staticmethod
+    def save_response(
+        request_key: str, route: str, response: Dict, session: Session
+    ) -> None:
+        cutoff = datetime.now() - timedelta(seconds=IDEMPOTENCY_TTL)
+        session.execute(delete(DbRequestKey).where(DbRequestKey.created_at < cutoff))
+        stmt = (
+            db.dialect_insert(session, DbRequestKey)
+            .values(
+                request_key=request_key,
+                route=route,
+                response=response,
+                created_at=datetime.now(),
+            )
+            .on_conflict_do_nothing()
+        )
+        session.execute(stmt)
+        session.commit()
+
+
+# ----------------- Tool statistics functions -----------------
+
+
+@traced_class()
+class StatsAccess:
+    @staticmethod
+    def record_completion(work: DbWork, session: Session) -> None:
+        """
+        Add completed work to the rollup of its tool, without committing.
+        """
+        now = datetime.now()
+        # a retried or dependent task waits from when it last became available
+        released = work.task.released_at or work.task.created_at
+        wait = max((work.created_at - released).total_seconds(), 0.0)
+        run = max((now - work.created_at).total_seconds(), 0.0)
+        succeeded = 1 if work.status == work_status.SUCCEEDED else 0
+        signature = work.tool.skills_signature or doc_signature(work.tool.tool_skills)
+        stmt = db.dialect_insert(session, DbToolStats).values(
+            tool_id=work.tool.tool_id,
+            skills_signature=signature,
+            completed=1,
+            succeeded=succeeded,
+            failed=1 - succeeded,
+            total_wait=wait,
+            total_run=run,
+            max_wait=wait,
+            max_run=run,
+            updated_at=now,
+        )
+        stats = DbToolStats.__table__.c
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["tool_id", "skills_signature"],
+                set_={
+                    "completed": stats.completed + 1,
+                    "succeeded": stats.succeeded + succeeded,
+                    "failed": stats.failed + 1 - succeeded,
+                    "total_wait": stats.total_wait + wait,
+                    "total_run": stats.total_run + run,
+                    "max_wait": case((stats.max_wait < wait, wait), else_=stats.max_wait),
+                    "max_run": case((stats.max_run < run, run), else_=stats.max_run),
+                    "updated_at": now,
+                },
+            )
+        )
+
+    @staticmethod
+    def record_queue_event(
+        needs_hash: str, session: Session, arrivals: int = 0, departures: int = 0
+    ) -> None:
+        """
+        Count tasks entering or leaving the queue in the current time bucket,
+        without committing.
+        """
+        now = datetime.now().timestamp()
+        bucket_start = datetime.fromtimestamp(now - now % FORECAST_BUCKET)
+        stmt = db.dialect_insert(session, DbQueueBucket).values(
+            needs_hash=needs_hash,
+            bucket_start=bucket_start,
+            arrivals=arrivals,
+            departures=departures,
+        )
+        buckets = DbQueueBucket.__table__.c
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["needs_hash", "bucket_start"],
+                set_={
+                    "arrivals": buckets.arrivals + arrivals,
+                    "departures": buckets.departures + departures,
+                },
+            )
+        )
+
+    @staticmethod
+    def get_queue_forecast(
+        session: Session, needs_hash: str | None = None
+    ) -> list[QueueForecast]:
+        """
+        Get the queue depth, the arrival and service rates over the sliding
+        window and the projected wait of a new task per needs signature.
+        """
+        now = datetime.now()
+        cutoff = now - timedelta(seconds=FORECAST_WINDOW)
+        queued = (
+            select(DbTask.needs_hash, func.count(), func.min(DbTask.created_at))
+            .where(DbTask.work_id == None, DbTask.dead_letter == False)
+            .group_by(DbTask.needs_hash)
+        )
+        rates = select(
+            DbQueueBucket.needs_hash,
+            func.sum(DbQueueBucket.arrivals),
+            func.sum(DbQueueBucket.departures),
+            func.min(DbQueueBucket.bucket_start),
+        )
+        rates = rates.where(DbQueueBucket.bucket_start >= cutoff).group_by(
+            DbQueueBucket.needs_hash
+        )
+        if needs_hash is not None:
+            queued = queued.where(DbTask.needs_hash == needs_hash)
+            rates = rates.where(DbQueueBucket.needs_hash == needs_hash)
+
+        forecasts: dict[str, QueueForecast] = {}
+        for key, depth, oldest in session.exec(queued).all():
+            forecasts[key] = QueueForecast(
+                needs_hash=key,
+                depth=depth,
+                oldest_wait_seconds=(now - oldest).total_seconds(),
+            )
+        for key, arrivals, departures, first_bucket in session.exec(rates).all():
+            # a window that started recently must not dilute the rates
+            minutes = max((now - first_bucket).total_seconds(), FORECAST_BUCKET) / 60
+            forecast = forecasts.setdefault(key, QueueForecast(needs_hash=key))
+            forecast.arrival_rate = arrivals / minutes
+            forecast.service_rate = departures / minutes
+        if needs_hash is not None and needs_hash not in forecasts:
+            forecasts[needs_hash] = QueueForecast(needs_hash=needs_hash)
+        for forecast in forecasts.values():
+            if forecast.service_rate > 0:
+                forecast.projected_wait_seconds = (
+                    60 * (forecast.depth + 1) / forecast.service_rate
+                )
+        return sorted(forecasts.values(), key=lambda forecast: -forecast.depth)
+
+    @staticmethod
+    def prune_queue_buckets(session: Session) -> int:
+        """
+        Delete the queue buckets that left the forecast window, returning
+        their number.
+        """
+        cutoff = datetime.now() - timedelta(seconds=FORECAST_WINDOW)
+        result = session.execute(
+            delete(DbQueueBucket).where(DbQueueBucket.bucket_start < cutoff)
+        )
+        session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def get_all_tool_stats(session: Session) -> list[DbToolStats]:
+        return session.exec(select(DbToolStats).order_by(DbToolStats.tool_id)).all()
+
+    @staticmethod
+    def get_signature_stats(session: Session) -> list[DbToolStats]:
+        """
+        Get the rollups summed over the tools per skills signature, as
+        statistics without a tool_id. Reads one rollup row per tool and
+        signature, not the archive.
+        """
+        stats = DbToolStats.__table__.c
+        rows = session.execute(
+            select(
+                stats.skills_signature,
+                func.sum(stats.completed),
+                func.sum(stats.succeeded),
+                func.sum(stats.failed),
+                func.sum(stats.total_wait),
+                func.sum(stats.total_run),
+                func.max(stats.max_wait),
+                func.max(stats.max_run),
+                func.max(stats.updated_at),
+            )
+            .group_by(stats.skills_signature)
+            .order_by(stats.skills_signature)
+        ).all()
+        return [
+            DbToolStats(
+                tool_id=None,
+                skills_signature=signature,
+                completed=completed,
+                succeeded=succeeded,
+                failed=failed,
+                total_wait=total_wait,
+                total_run=total_run,
+                max_wait=max_wait,
+                max_run=max_run,
+                updated_at=updated_at,
+            )
+            for (
+                signature,
+                completed,
+                succeeded,
+                failed,
+                total_wait,
+                total_run,
+                max_wait,
+                max_run,
+                updated_at,
+            ) in rows
+        ]
+
+    @staticmethod
+    def get_tool_stats(tool_id: str, session: Session) -> list[DbToolStats]:
+        items = session.exec(
+            select(DbToolStats).where(DbToolStats.tool_id == tool_id)
+        ).all()
+        if not items:
+            raise db.DB_ITEM_NOT_FOUND(f"No statistics for tool '{tool_id}'")
+        return items
+
+
+# ----------------- Memoization functions -----------------
+
+
+@traced_class()
+class MemoAccess:
+    @staticmethod
+    def remember(work: DbWork, session: Session) -> None:
+        """
+        Record successful work under its needs and skills fingerprint and
+        evict fingerprints older than MEMO_MAX_AGE, without committing.
+        """
+        now = datetime.now()
+        cutoff = now - timedelta(seconds=MEMO_MAX_AGE)
+        session.execute(delete(DbMemo).where(DbMemo.created_at < cutoff))
+        needs_hash = work.task.needs_hash or doc_signature(work.task.task_needs)
+        signature = work.tool.skills_signature or doc_signature(work.tool.tool_skills)
+        stmt = db.dialect_insert(session, DbMemo).values(
+            needs_hash=needs_hash,
+            skills_signature=signature,
+            work_id=work.work_id,
+            created_at=now,
+        )
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["needs_hash", "skills_signature"],
+                set_={"work_id": work.work_id, "created_at": now},
+            )
+        )
+
+    @staticmethod
+    def find_memo(needs_hash: str, namespace: str, session: Session) -> DbMemo | None:
+        """
+        Get the latest success for the needs in the namespace on a tool whose
+        skills match those of a currently enabled tool of the namespace.
+        """
+        cutoff = datetime.now() - timedelta(seconds=MEMO_MAX_AGE)
+        return session.exec(
+            select(DbMemo)
+            .join(DbTool, DbTool.skills_signature == DbMemo.skills_signature)
+            .join(DbArchive, DbArchive.work_id == DbMemo.work_id)
+            .where(
+                DbMemo.needs_hash == needs_hash,
+                DbMemo.created_at >= cutoff,
+                DbTool.enabled == True,
+                DbTool.namespace == namespace,
+                DbArchive.namespace == namespace,
+            )
+            .order_by(DbMemo.created_at.desc())
+            .limit(1)
+        ).first()
+
+    @staticmethod
+    def complete_from_memo(
+        task_create: TaskCreate,
+        memo: DbMemo,
+        session: Session,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> TaskOutcome:
+        """
+        Archive the task as succeeded with a reference to the earlier archive
+        entry instead of assigning it to a tool.
+        """
+        prior = session.get(DbArchive, memo.work_id)
+        if not prior:
+            session.delete(memo)
+            session.commit()
+            return TaskAccess.create_task(task_create, session, namespace)
+        work = DbWork(status=work_status.SUCCEEDED, completed=True, namespace=namespace)
+        session.add(work)
+        session.flush()
+        archive = DbArchive(
+            work_id=work.work_id,
+            namespace=namespace,
+            status=work_status.SUCCEEDED,
+            tool_id=prior.tool_id,
+            task_id=task_create.task_id,
+            needs_hash=memo.needs_hash,
+            task_needs=BlobAccess.offload(task_create.task_needs, session),
+            tool_skills=prior.tool_skills,
+            reports={"reports": []},
+            memo_of=prior.work_id,
+            created_at=datetime.now(),
+        )
+        session.add(archive)
+        session.delete(work)
+        session.commit()
+        return TaskOutcome(
+            message=f"Task {task_create.task_id} completed from archived work item {prior.work_id}",
+            task_id=task_create.task_id,
+            work_id=archive.work_id,
+        )
+
+
+# ----------------- Blob functions -----------------
+
+
+@traced_class()
+class BlobAccess:
+    @staticmethod
+    def offload(doc: Dict | None, session: Session) -> Dict | None:
+        """
+        Store the large top-level values of a document as blobs and replace
+        them with references, without committing.
+        """
+        if not doc or not BLOB_THRESHOLD:
+            return doc
+        stored = {}
+        for key, value in doc.items():
+            canonical = None if is_blob_ref(value) else canonical_json(value)
+            if canonical is None or not is_large(canonical):
+                stored[key] = value
+                continue
+            content = canonical.encode()
+            stored[key] = {
+                BLOB_KEY: BlobAccess.put_blob(content, session),
+                "size": len(content),
+            }
+        return stored
+
+    @staticmethod
+    def put_blob(content: bytes, session: Session) -> str:
+        digest = blob_hash(content)
+        on_disk = BLOB_STORE == "disk"
+        if on_disk:
+            path = BlobAccess._blob_path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                partial = f"{path}.{os.getpid()}.tmp"
+                with open(partial, "wb") as file:
+                    file.write(content)
+                os.replace(partial, path)
+        stmt = db.dialect_insert(session, DbBlob).values(
+            blob_hash=digest,
+            size=len(content),
+            data=None if on_disk else content,
+            created_at=datetime.now(),
+        )
+        session.execute(stmt.on_conflict_do_nothing())
+        return digest
+
+    @staticmethod
+    def get_blob_size(digest: str, session: Session) -> int:
+        size = session.exec(
+            select(DbBlob.size).where(DbBlob.blob_hash == digest)
+        ).one_or_none()
+        if size is None:
+            raise db.DB_ITEM_NOT_FOUND(f"Blob '{digest}' does not exist")
+        return size
+
+    @staticmethod
+    def read_blob(digest: str, start: int, end: int, session: Session) -> bytes:
+        """Read the bytes start..end (inclusive) of a blob"""
+        row = session.exec(
+            select(
+                DbBlob.data == None,
+                func.substr(DbBlob.data, start + 1, end - start + 1),
+            ).where(DbBlob.blob_hash == digest)
+        ).one_or_none()
+        if row is None:
+            raise db.DB_ITEM_NOT_FOUND(f"Blob '{digest}' does not exist")
+        on_disk, content = row
+        if not on_disk:
+            return bytes(content)
+        with open(BlobAccess._blob_path(digest), "rb") as file:
+            file.seek(start)
+            return file.read(end - start + 1)
+
+    @staticmethod
+    def _blob_path(digest: str) -> str:
+        return os.path.join(BLOB_DIR, digest[:2], digest)
+
+
+# ----------------- Table version functions -----------------
+
+
+@traced_class()
+class VersionAccess:
+    @staticmethod
+    def get_etag(tables: list[str], session: Session, *extra) -> str:
+        """
+        Get a weak ETag that changes whenever any of the tables is modified
+        or any of the extra values changes.
+        """
+        rows = session.exec(
+            select(DbTableVersion.name, DbTableVersion.version)
+            .where(DbTableVersion.name.in_(tables))
+            .order_by(DbTableVersion.name)
+        ).all()
+        parts = [f"{name}.{version}" for name, version in rows]
+        parts += [str(value).replace(" ", "T") for value in extra]
+        tag = "-".join(parts)
+        return f'W/"{tag}"'
+
+
 # ----------------- Work Archive functions -----------------
+@traced_class()
 class ArchiveAccess:
     @staticmethod
-    def get_all_archived_work(session: Session) -> list[DbArchive]:
-        return session.exec(select(DbArchive)).all()
+    def get_all_archived_work(
+        session: Session, namespace: str | None = None
+    ) -> list[DbArchive]:
+        stmt = select(DbArchive)
+        if namespace is not None:
+            stmt = stmt.where(DbArchive.namespace == namespace)
+        return session.exec(stmt).all()
 
     def delete_all_archived_work(session: Session):
         items = session.exec(select(DbArchive)).all()
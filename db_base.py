@@ -1,7 +1,17 @@
-import os
+import time
+from sqlalchemy import event, inspect, literal, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.pool import QueuePool
 from sqlmodel import SQLModel, Session, create_engine
-from db_config import get_db_url
-import db_models  # do not remove this import
+from db_config import DB_BACKEND, SQL_PROFILE, get_db_url, get_engine_options
+from db_profile import enable_profiling
+from db_trace import enable_tracing, tracer
+# importing db_models registers all tables on SQLModel.metadata
+from db_models import DbTableVersion
+
+# tables whose changes are counted in table_versions
+VERSIONED_TABLES = ["tools", "tasks", "work", "work_reports", "work_archive"]
 
 
 class DB_ITEM_NOT_FOUND(Exception):
@@ -20,14 +30,196 @@ class DB_WRONG_STATUS(Exception):
     pass
 
 
+class DB_QUOTA_EXCEEDED(Exception):
+    pass
+
+
 engine = None
 
 
-def create_engine_and_tables():
+def create_engine_and_tables(backend: str = DB_BACKEND):
     if not engine:
-        url = get_db_url()
-        globals()["engine"] = create_engine(url)
+        url = get_db_url(backend=backend)
+        options = {"poolclass": MonitoredQueuePool, **get_engine_options(backend)}
+        globals()["engine"] = create_engine(url, **options)
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", _set_sqlite_pragmas)
+        if SQL_PROFILE:
+            enable_profiling(engine)
+        if tracer.enabled:
+            enable_tracing(engine)
         SQLModel.metadata.create_all(engine)
+        add_missing_columns()
+        create_table_versions()
+
+
+def use_backend(backend: str):
+    """
+    Replace the engine with a new one for the backend, e.g. a fresh
+    "scratch" database for tests and simulations.
+    """
+    if engine:
+        engine.dispose()
+    globals()["engine"] = None
+    create_engine_and_tables(backend)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def add_missing_columns():
+    """
+    Bring tables created by an older version up to date: create_all only
+    creates missing tables, so add the model columns (with their default for
+    the existing rows) and the indexes that an existing table lacks.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    connection.execute(text(_add_column_ddl(column, engine.dialect)))
+                    if column.unique:
+                        connection.execute(
+                            text(
+                                f"CREATE UNIQUE INDEX uq_{table.name}_{column.name} "
+                                f"ON {table.name} ({column.name})"
+                            )
+                        )
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+
+
+def _add_column_ddl(column, dialect) -> str:
+    ddl = f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column.type.compile(dialect)}"
+    default = column.default
+    if default is not None and default.is_scalar:
+        value = literal(default.arg, column.type).compile(
+            dialect=dialect, compile_kwargs={"literal_binds": True}
+        )
+        ddl += f" DEFAULT {value}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def create_table_versions():
+    """
+    Make sure every versioned table has a counter. Counters start from the
+    current time so that versions are not reused when the database is recreated.
+    """
+    with Session(engine) as session:
+        rows = [
+            {"name": name, "version": int(time.time() * 1000)}
+            for name in VERSIONED_TABLES
+        ]
+        stmt = dialect_insert(session, DbTableVersion).values(rows)
+        session.execute(stmt.on_conflict_do_nothing())
+        session.commit()
+
+
+def _bump_table_versions(connection, tables: set[str]):
+    versions = DbTableVersion.__table__
+    for name in VERSIONED_TABLES:
+        if name in tables:
+            connection.execute(
+                update(versions)
+                .where(versions.c.name == name)
+                .values(version=versions.c.version + 1)
+            )
+
+
+def _note_changes(session: Session, tables: set[str]):
+    session.info.setdefault("changed_tables", set()).update(tables)
+
+
+@event.listens_for(Session, "after_flush")
+def _count_flushed_changes(session: Session, flush_context):
+    changed = (*session.new, *session.dirty, *session.deleted)
+    _note_changes(session, {item.__tablename__ for item in changed})
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _count_statement_changes(orm_execute_state):
+    # statements that cannot change what clients see opt out with bump_versions=False
+    if not orm_execute_state.execution_options.get("bump_versions", True):
+        return
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table
+        _note_changes(orm_execute_state.session, {table.name})
+
+
+@event.listens_for(Session, "before_commit")
+def _publish_changes(session: Session):
+    """
+    Bump the counters of the tables changed by the transaction on its own
+    connection, just before it commits. Pending changes are flushed first so
+    that they are counted, and the counters are taken in a fixed order, so
+    writers hold them only for the commit and never deadlock on them.
+    """
+    session.flush()
+    tables = session.info.pop("changed_tables", None)
+    if tables:
+        _bump_table_versions(session.connection(), tables)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changes(session: Session):
+    session.info.pop("changed_tables", None)
+
+
+def dialect_insert(session: Session, model):
+    """
+    Get an INSERT statement for the model that supports the ON CONFLICT
+    clauses of the dialect the session is bound to.
+    """
+    if session.get_bind().dialect.name == "sqlite":
+        return sqlite_insert(model.__table__)
+    return pg_insert(model.__table__)
+
+
+class CheckoutMonitor:
+    """
+    Moving average of the time spent waiting for a pooled connection.
+    The average decays while no checkouts are measured.
+    """
+
+    def __init__(self, weight: float = 0.2, half_life: float = 1.0):
+        self.weight = weight
+        self.half_life = half_life
+        self._average = 0.0
+        self._updated = time.monotonic()
+
+    def record(self, wait: float):
+        self._average = self.current() * (1 - self.weight) + wait * self.weight
+        self._updated = time.monotonic()
+
+    def current(self) -> float:
+        elapsed = time.monotonic() - self._updated
+        return self._average * 0.5 ** (elapsed / self.half_life)
+
+
+checkout_monitor = CheckoutMonitor()
+
+
+class MonitoredQueuePool(QueuePool):
+    """Queue pool that feeds the time spent waiting for a connection to checkout_monitor"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            checkout_monitor.record(time.perf_counter() - start)
 
 
 # Dependency to get the database session
@@ -1,12 +1,20 @@
 import random
+import time
 from sqlmodel import Session
-from api_models import ReportCreate, TaskCreate, ToolCreate, WorkCreate, WorkInfo
-from db_models import DbTask, DbTool, DbWork, DbReport
+from api_models import (
+    ReportCreate,
+    TaskCreate,
+    ToolCreate,
+    ToolSelector,
+    WorkCreate,
+)
+from db_models import DbTool, DbWork
 import db_base as db
 from db_base import (
     DB_ITEM_NOT_FOUND,
     DB_ITEM_ALREADY_EXISTS,
     DB_ITEM_REFERENCED,
+    DB_QUOTA_EXCEEDED,
     DB_WRONG_STATUS,
 )
 from db_models import work_status
@@ -58,6 +66,8 @@ def handle_db_exceptions(func):
             print(str(e))
         except DB_WRONG_STATUS as e:
             print(str(e))
+        except DB_QUOTA_EXCEEDED as e:
+            print(str(e))
 
     return wrapper
 
@@ -115,9 +125,10 @@ class ToolOps:
             if not tools:
                 print("No tools to mark as ready")
                 return
-            for tool_id in tools:
-                ToolAccess.tool_ready(tool_id, session)
-                print(f"Tool '{tool_id}' marked as ready")
+            result = ToolAccess.tools_ready(ToolSelector(tool_ids=tools), session)
+            print(result.message)
+            for skipped in result.skipped:
+                print(f"Tool '{skipped.tool_id}' skipped: {skipped.reason}")
 
 
 class TaskOps:
@@ -159,7 +170,8 @@ class ReportOps:
                     details={"details": "Success report"},
                 )
                 WorkAccess.create_work_report(work_id, rpt1, session)
-                WorkAccess.work_succeeded(work_id, rpt2, session)
+                WorkAccess.create_work_report(work_id, rpt2, session)
+                WorkAccess.work_succeeded(work_id, session)
                 print(f"Reports created for work '{work_id}'")
 
     @handle_db_exceptions
@@ -180,11 +192,12 @@ class WorkOps:
             if not tools or not tasks:
                 print("No viable work candidates found")
                 return
-            pairs_list = list(zip(tools, tasks))
-            for tool, task in pairs_list[:n]:
-                work_create = WorkCreate(tool_id=tool.tool_id, task_id=task.task_id)
-                result = WorkAccess.create_work(work_create, session)
-                print(result)
+            pairs_list = [
+                WorkCreate(tool_id=tool.tool_id, task_id=task.task_id)
+                for tool, task in zip(tools, tasks)
+            ]
+            result = WorkAccess.create_work_batch(pairs_list[:n], session)
+            print(result)
 
     @handle_db_exceptions
     @staticmethod
@@ -301,6 +314,28 @@ class ArchiveOps:
             return result
 
 
+def run_lifecycles(n: int = 1000):
+    """
+    Run n complete tool/task/work lifecycles and print the rate, e.g. with
+    DB_BACKEND=scratch to measure the service without a database server.
+    """
+    start = time.perf_counter()
+    with Session(db.engine) as session:
+        for i in range(n):
+            tool_create = ToolCreate(tool_id=f"Tool-{i}", tool_skills={"skill": i})
+            task_create = TaskCreate(task_id=f"Task-{i}", task_needs={"skill": i})
+            ToolAccess.create_tool(tool_create, session)
+            TaskAccess.create_task(task_create, session)
+            ToolAccess.tool_ready(tool_create.tool_id, session)
+            pair = WorkCreate(tool_id=tool_create.tool_id, task_id=task_create.task_id)
+            work_id = WorkAccess.create_work_batch([pair], session).work_ids[0]
+            report = ReportCreate(status=work_status.PROCESSING, details={"step": 1})
+            WorkAccess.create_work_report(work_id, report, session)
+            WorkAccess.work_succeeded(work_id, session)
+    elapsed = time.perf_counter() - start
+    print(f"{n} lifecycles in {elapsed:.2f}s ({n / elapsed:.0f}/s)")
+
+
 def delete_all():
     ToolOps.delete_all_tools()
     TaskOps.delete_all_tasks()
@@ -325,6 +360,7 @@ def main():
     # work = WorkOps.get_work(22)
     # work_info = WorkInfo().from_work(work)
     # archive_list = ArchiveOps.get_all_archived_work()
+    # run_lifecycles(1000)
     archive_info = ArchiveOps.get_archived_work(22)
     print("Done")
 
@@ -1,5 +1,8 @@
+import atexit
+import json
 import yaml
 import os
+import tempfile
 
 POSTGRES_USER = os.environ.get("POSTGRES_USER", "nothing")
 POSTGRES_PASSWORD = os.environ.get("POSTGRES_PASSWORD", "nothing")
@@ -7,11 +10,89 @@ POSTGRES_DB = os.environ.get("POSTGRES_DB", "nothing")
 POSTGRES_HOST = os.environ.get("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = os.environ.get("POSTGRES_PORT", "5432")
 
+# storage backend: "postgres", "sqlite" (file at SQLITE_PATH) or "scratch"
+# (throwaway SQLite file in /dev/shm for tests, still SQL and not an in-memory engine)
+DB_BACKEND = os.environ.get("DB_BACKEND", "postgres")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "rho.db")
 
-def get_db_url(db_key: str = "db_production") -> str:
+# attribute SQL statements to access methods and routes, and log slow ones
+SQL_PROFILE = os.environ.get("SQL_PROFILE", "0").lower() in ("1", "true", "yes")
+SLOW_QUERY_TIME = float(os.environ.get("SLOW_QUERY_TIME", "0.2"))
+
+# collapse tasks with identical needs into the existing task (or its recent
+# successful archive entry within TASK_DEDUP_WINDOW seconds)
+TASK_DEDUP = os.environ.get("TASK_DEDUP", "0").lower() in ("1", "true", "yes")
+TASK_DEDUP_WINDOW = int(os.environ.get("TASK_DEDUP_WINDOW", "86400"))
+
+# complete new tasks from a recent success with the same needs on a tool with
+# the same skills, remembering successes for MEMO_MAX_AGE seconds
+TASK_MEMOIZE = os.environ.get("TASK_MEMOIZE", "0").lower() in ("1", "true", "yes")
+MEMO_MAX_AGE = int(os.environ.get("MEMO_MAX_AGE", "604800"))
+
+# failed tasks are retried after RETRY_BACKOFF_BASE * 2^(attempts - 1) seconds
+# (at most RETRY_BACKOFF_MAX) until they have failed TASK_MAX_ATTEMPTS times,
+# then they are dead-lettered
+TASK_MAX_ATTEMPTS = int(os.environ.get("TASK_MAX_ATTEMPTS", "5"))
+RETRY_BACKOFF_BASE = float(os.environ.get("RETRY_BACKOFF_BASE", "30"))
+RETRY_BACKOFF_MAX = float(os.environ.get("RETRY_BACKOFF_MAX", "3600"))
+
+# trace requests, access methods, response building and SQL statements for a
+# fraction TRACE_SAMPLE_RATE of the requests (0 disables tracing); spans are kept
+# in memory (the last TRACE_BUFFER) or appended to TRACE_FILE as JSON lines
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "memory")
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_BUFFER = int(os.environ.get("TRACE_BUFFER", "10000"))
+
+# tools without a heartbeat (assignment poll or ready call) for this many
+# seconds are not offered as available (0 keeps tools available indefinitely)
+TOOL_LIVENESS_TTL = int(os.environ.get("TOOL_LIVENESS_TTL", "300"))
+
+# tools advertise the host their data lives on under this key in tool_skills,
+# tasks with a locality hint wait up to LOCALITY_FALLBACK_DELAY seconds for a
+# co-located tool before server-side assignment sends them to any other tool
+LOCALITY_SKILL_KEY = os.environ.get("LOCALITY_SKILL_KEY", "locality")
+LOCALITY_FALLBACK_DELAY = float(os.environ.get("LOCALITY_FALLBACK_DELAY", "60"))
+
+# queue arrivals and departures are counted per needs signature in buckets of
+# FORECAST_BUCKET seconds, rates are taken over the last FORECAST_WINDOW seconds
+FORECAST_WINDOW = int(os.environ.get("FORECAST_WINDOW", "3600"))
+FORECAST_BUCKET = int(os.environ.get("FORECAST_BUCKET", "60"))
+
+# directory and batch size (archived work items per batch) of archive exports
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "exports")
+EXPORT_BATCH = int(os.environ.get("EXPORT_BATCH", "1000"))
+
+# top-level values of task needs and report details whose JSON is longer than
+# BLOB_THRESHOLD bytes (0 disables) are stored once in a content-addressed blob
+# store, the "database" or files under BLOB_DIR ("disk"), and replaced by a
+# {"$blob": hash, "size": bytes} reference
+BLOB_THRESHOLD = int(os.environ.get("BLOB_THRESHOLD", "65536"))
+BLOB_STORE = os.environ.get("BLOB_STORE", "database")
+BLOB_DIR = os.environ.get("BLOB_DIR", "blobs")
+
+# every tool, task and work item belongs to a namespace, taken from the
+# X-Namespace header of the request (DEFAULT_NAMESPACE when it is absent);
+# NAMESPACE_QUOTAS limits the queued tasks and active work items per namespace,
+# e.g. {"lab-a": {"tasks": 10000, "work": 50}}, with the "*" entry applying to
+# namespaces that are not listed (a missing or 0 limit is unlimited)
+DEFAULT_NAMESPACE = os.environ.get("DEFAULT_NAMESPACE", "default")
+NAMESPACE_QUOTAS = json.loads(os.environ.get("NAMESPACE_QUOTAS", "{}"))
+
+# seconds an Idempotency-Key is remembered before a retry is treated as new
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", "86400"))
+
+
+def get_db_url(db_key: str = "db_production", backend: str = DB_BACKEND) -> str:
     """
     Get url to connect to the database from the configuration file.
     """
+    if backend == "scratch":
+        return f"sqlite:///{get_scratch_path()}"
+    if backend == "sqlite":
+        return f"sqlite:///{SQLITE_PATH}"
+    if backend != "postgres":
+        raise ValueError(f"Unknown storage backend '{backend}'")
     dialect = "postgresql+psycopg2"
     host = POSTGRES_HOST
     port = POSTGRES_PORT
@@ -22,3 +103,32 @@ def get_db_url(db_key: str = "db_production") -> str:
     database_url = f"{dialect}://{username}:{password}@{host}:{port}/{database}"
     print(f"Database URL: {database_url}")
     return database_url
+
+
+def get_engine_options(backend: str = DB_BACKEND) -> dict:
+    """
+    Get the engine arguments needed by the backend.
+    """
+    if backend in ("scratch", "sqlite"):
+        return {"connect_args": {"check_same_thread": False}}
+    return {}
+
+
+def get_scratch_path() -> str:
+    """
+    Get a fresh database file for the "scratch" backend, in shared memory
+    where available, removed at exit. Unlike a sqlite:// database it gets a
+    connection per session, so concurrent sessions are serialized by SQLite's
+    database lock instead of interleaving on one shared connection.
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    handle, path = tempfile.mkstemp(prefix="rho-", suffix=".db", dir=directory)
+    os.close(handle)
+    atexit.register(_remove_database, path)
+    return path
+
+
+def _remove_database(path: str):
+    for name in (path, f"{path}-wal", f"{path}-shm"):
+        if os.path.exists(name):
+            os.remove(name)
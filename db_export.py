@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+from datetime import date, datetime
+from sqlmodel import Session, select
+import db_base as db
+from db_config import EXPORT_BATCH, EXPORT_DIR
+from db_models import DbArchive
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional, only the export needs it
+    pa = None
+
+""" Export of the work archive to columnar files for offline analysis """
+
+EXPORT_FORMATS = ("parquet", "arrow")
+
+
+def archive_schema():
+    """One row per report of an archived work item, JSON documents as text"""
+    return pa.schema(
+        [
+            ("work_id", pa.int64()),
+            ("namespace", pa.string()),
+            ("status", pa.string()),
+            ("tool_id", pa.string()),
+            ("task_id", pa.string()),
+            ("needs_hash", pa.string()),
+            ("memo_of", pa.int64()),
+            ("task_needs", pa.string()),
+            ("tool_skills", pa.string()),
+            ("created_at", pa.timestamp("us")),
+            ("archived_at", pa.timestamp("us")),
+            ("report_index", pa.int32()),
+            ("report_status", pa.string()),
+            ("report_details", pa.string()),
+            ("report_created_at", pa.string()),
+        ]
+    )
+
+
+def flatten_archive(archive: DbArchive) -> list[dict]:
+    """
+    Get the export rows for an archived work item, one per report (or a single
+    row without report columns when it has none).
+    """
+    row = {
+        "work_id": archive.work_id,
+        "namespace": archive.namespace,
+        "status": archive.status,
+        "tool_id": archive.tool_id,
+        "task_id": archive.task_id,
+        "needs_hash": archive.needs_hash,
+        "memo_of": archive.memo_of,
+        "task_needs": json.dumps(archive.task_needs),
+        "tool_skills": json.dumps(archive.tool_skills),
+        "created_at": archive.created_at,
+        "archived_at": archive.archived_at,
+    }
+    reports = (archive.reports or {}).get("reports", [])
+    if not reports:
+        return [row]
+    return [
+        {
+            **row,
+            "report_index": index,
+            "report_status": report.get("status"),
+            "report_details": json.dumps(report.get("details")),
+            "report_created_at": report.get("created_at"),
+        }
+        for index, report in enumerate(reports)
+    ]
+
+
+class PartitionWriter:
+    """
+    Writes batches of rows to one file per archive date, e.g.
+    <directory>/archive_date=2024-05-01/work_archive.parquet
+    """
+
+    def __init__(self, directory: str, file_format: str):
+        self.directory = directory
+        self.file_format = file_format
+        self.schema = archive_schema()
+        self.partition: date | None = None
+        self.writer = None
+        self.sink = None
+        self.files: list[str] = []
+
+    def write(self, partition: date, rows: list[dict]):
+        if partition != self.partition:
+            self.close()
+            self._open(partition)
+        batch = pa.RecordBatch.from_pylist(rows, schema=self.schema)
+        self.writer.write_batch(batch)
+
+    def _open(self, partition: date):
+        folder = os.path.join(self.directory, f"archive_date={partition.isoformat()}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"work_archive.{self.file_format}")
+        if self.file_format == "parquet":
+            self.writer = pa.parquet.ParquetWriter(path, self.schema)
+        else:
+            self.sink = pa.OSFile(path, "wb")
+            self.writer = pa.ipc.new_file(self.sink, self.schema)
+        self.partition = partition
+        self.files.append(path)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        if self.sink:
+            self.sink.close()
+        self.writer = None
+        self.sink = None
+
+
+def export_archive(
+    session: Session,
+    directory: str = EXPORT_DIR,
+    file_format: str = "parquet",
+    since: datetime | None = None,
+    until: datetime | None = None,
+    batch_size: int = EXPORT_BATCH,
+) -> tuple[int, list[str]]:
+    """
+    Stream the archive in archived_at order through a server-side cursor and
+    write it partitioned by date, holding at most one batch of rows in memory.
+    Returns the number of rows and the files written.
+    """
+    if pa is None:
+        raise RuntimeError("The archive export requires pyarrow to be installed")
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{file_format}'")
+    stmt = select(DbArchive).order_by(DbArchive.archived_at, DbArchive.work_id)
+    if since:
+        stmt = stmt.where(DbArchive.archived_at >= since)
+    if until:
+        stmt = stmt.where(DbArchive.archived_at < until)
+    stmt = stmt.execution_options(yield_per=batch_size)
+
+    writer = PartitionWriter(directory, file_format)
+    total = 0
+    rows: list[dict] = []
+    partition = None
+    try:
+        for archive in session.exec(stmt):
+            archive_date = archive.archived_at.date()
+            if rows and (archive_date != partition or len(rows) >= batch_size):
+                writer.write(partition, rows)
+                rows = []
+            partition = archive_date
+            rows.extend(flatten_archive(archive))
+            total += 1
+            # archive rows are only read once
+            session.expunge(archive)
+        if rows:
+            writer.write(partition, rows)
+    finally:
+        writer.close()
+    return total, writer.files
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the work archive to date-partitioned Parquet or Arrow files"
+    )
+    parser.add_argument("--out", default=EXPORT_DIR, help="output directory")
+    parser.add_argument("--format", default="parquet", choices=list(EXPORT_FORMATS))
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--batch", type=int, default=EXPORT_BATCH)
+    args = parser.parse_args()
+
+    db.create_engine_and_tables()
+    with Session(db.engine) as session:
+        total, files = export_archive(
+            session, args.out, args.format, args.since, args.until, args.batch
+        )
+    print(f"{total} archived work items exported to {len(files)} files")
+    for path in files:
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import hashlib
+import json
+from typing import Dict
+from db_config import BLOB_THRESHOLD
+
+""" Normalization of skills and needs documents into comparable keys """
+
+# key given to documents without any entries so that they still match
+ANY_KEY = hashlib.sha1(b"*").hexdigest()
+
+# key of the reference that replaces a value offloaded to the blob store
+BLOB_KEY = "$blob"
+
+
+def canonical_json(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def blob_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def is_blob_ref(value) -> bool:
+    return isinstance(value, dict) and BLOB_KEY in value
+
+
+def is_large(canonical: str) -> bool:
+    return BLOB_THRESHOLD > 0 and len(canonical) > BLOB_THRESHOLD
+
+
+def value_ref(value):
+    """
+    Get the blob reference for a large value (or a reference), otherwise the
+    value itself. A large value and the reference it is replaced by compare
+    equal, so keys and signatures do not depend on whether it was offloaded.
+    """
+    if is_blob_ref(value):
+        return {BLOB_KEY: value[BLOB_KEY]}
+    canonical = canonical_json(value)
+    if is_large(canonical):
+        return {BLOB_KEY: blob_hash(canonical.encode())}
+    return value
+
+
+def doc_signature(doc: Dict) -> str:
+    """Get a hash that identifies the whole content of a document"""
+    normalized = {key: value_ref(value) for key, value in doc.items()}
+    return hashlib.sha1(canonical_json(normalized).encode()).hexdigest()
+
+
+def skill_keys(doc: Dict) -> list[str]:
+    """
+    Get the normalized key/value pairs of a skills or needs document, hashed
+    to a fixed length so that they can be indexed.
+    """
+    pairs = {
+        f"{str(key).strip()}={canonical_json(value_ref(value))}"
+        for key, value in doc.items()
+    }
+    return sorted(hashlib.sha1(pair.encode()).hexdigest() for pair in pairs)
@@ -1,9 +1,10 @@
 from datetime import datetime
 from typing import Dict, List, Optional
 from pydantic import BaseModel
-from sqlalchemy import JSON, Column, DateTime, func
+from sqlalchemy import JSON, BigInteger, Column, DateTime, Index, LargeBinary, func, text
 from sqlmodel import Field, SQLModel
 from sqlmodel import Relationship
+from db_config import DEFAULT_NAMESPACE
 
 
 class WorkStatusCodes(BaseModel):
@@ -15,46 +16,106 @@ class WorkStatusCodes(BaseModel):
 
 work_status = WorkStatusCodes()
 
+# statuses a work item may move to from each status
+work_transitions = {
+    work_status.NEW: {work_status.PROCESSING, work_status.FAILED, work_status.SUCCEEDED},
+    work_status.PROCESSING: {
+        work_status.PROCESSING,
+        work_status.FAILED,
+        work_status.SUCCEEDED,
+    },
+    work_status.FAILED: set(),
+    work_status.SUCCEEDED: set(),
+}
+
+
+def work_sources(status: str) -> list[str]:
+    """Get the statuses from which a work item may move to the status"""
+    return [source for source, targets in work_transitions.items() if status in targets]
+
 
 class DbTool(SQLModel, table=True):
     __tablename__ = "tools"
+    __table_args__ = (
+        Index("ix_tools_available", "free_slots", "ready_since"),
+        Index("ix_tools_namespace_available", "namespace", "free_slots", "ready_since"),
+    )
     tool_id: str = Field(primary_key=True)
+    namespace: str = Field(default=DEFAULT_NAMESPACE)
     tool_skills: Dict = Field(sa_column=Column(JSON))
+    skills_signature: str | None = Field(default=None, index=True)
+    locality: str | None = Field(default=None, index=True)
     created_at: datetime = Field(
         sa_column=Column(DateTime(), server_default=func.now())
     )
     enabled: bool = Field(default=True)
     ready_since: datetime | None = Field(default=None)
-    work_id: Optional[int] = Field(foreign_key="work.work_id")
-    work: Optional["DbWork"] = Relationship(back_populates="tool")
+    last_seen: datetime | None = Field(default=None, index=True)
+    capacity: int = Field(default=1)
+    free_slots: int = Field(default=1)
+    work_items: List["DbWork"] = Relationship(
+        back_populates="tool", sa_relationship_kwargs={"order_by": "DbWork.work_id"}
+    )
 
 
 class DbTask(SQLModel, table=True):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_namespace_queue", "namespace", "work_id", "created_at"),
+        # unassigned tasks that are due, scheduled and backed off tasks stay out
+        Index(
+            "ix_tasks_ready",
+            "namespace",
+            "created_at",
+            sqlite_where=text("work_id IS NULL AND eligible_at IS NULL"),
+            postgresql_where=text("work_id IS NULL AND eligible_at IS NULL"),
+        ),
+    )
     task_id: str = Field(primary_key=True)
+    namespace: str = Field(default=DEFAULT_NAMESPACE)
     task_needs: Dict = Field(sa_column=Column(JSON))
+    needs_hash: str | None = Field(default=None, index=True)
+    dedup_key: str | None = Field(default=None, unique=True)
+    locality: str | None = Field(default=None, index=True)
     created_at: datetime = Field(
         sa_column=Column(DateTime(), server_default=func.now())
     )
+    attempts: int = Field(default=0)
+    max_attempts: int | None = Field(default=None)
+    eligible_at: datetime | None = Field(default=None, index=True)
+    # when the task last became available again, None while that is created_at
+    released_at: datetime | None = Field(default=None)
+    dead_letter: bool = Field(default=False)
+    pending_deps: int = Field(default=0)
+    upstream: Dict | None = Field(default=None, sa_column=Column(JSON))
     work_id: int | None = Field(foreign_key="work.work_id")
     work: Optional["DbWork"] = Relationship(back_populates="task")
 
 
 class DbWork(SQLModel, table=True):
     __tablename__ = "work"
+    # work ids must not be reused by sqlite, they become archive keys
+    __table_args__ = (
+        Index("ix_work_namespace_status", "namespace", "status"),
+        {"sqlite_autoincrement": True},
+    )
     work_id: int | None = Field(default=None, primary_key=True)
+    namespace: str = Field(default=DEFAULT_NAMESPACE)
     status: str = Field(default=work_status.NEW)
     completed: bool = Field(default=False)
+    version: int = Field(default=0)
     created_at: datetime = Field(
         sa_column=Column(DateTime(), server_default=func.now())
     )
+    tool_id: str | None = Field(default=None, foreign_key="tools.tool_id", index=True)
     task: Optional[DbTask] = Relationship(back_populates="work")
-    tool: Optional[DbTool] = Relationship(back_populates="work")
+    tool: Optional[DbTool] = Relationship(back_populates="work_items")
     reports: List["DbReport"] = Relationship(back_populates="work")
 
 
 class DbReport(SQLModel, table=True):
     __tablename__ = "work_reports"
+    __table_args__ = (Index("ix_work_reports_work_id_id", "work_id", "id"),)
     id: int | None = Field(default=None, primary_key=True)
     work_id: int | None = Field(foreign_key="work.work_id")
     status: str
@@ -67,13 +128,20 @@ class DbReport(SQLModel, table=True):
 
 class DbArchive(SQLModel, table=True):
     __tablename__ = "work_archive"
+    __table_args__ = (
+        Index("ix_work_archive_needs_hash", "needs_hash", "archived_at"),
+        Index("ix_work_archive_namespace", "namespace", "archived_at"),
+    )
     work_id: int = Field(primary_key=True)
+    namespace: str = Field(default=DEFAULT_NAMESPACE)
     status: str
     tool_id: str
     task_id: str
+    needs_hash: str | None = Field(default=None)
     task_needs: Dict = Field(sa_column=Column(JSON))
     tool_skills: Dict = Field(sa_column=Column(JSON))
     reports: Dict = Field(sa_column=Column(JSON))
+    memo_of: int | None = Field(default=None)
     created_at: datetime
     archived_at: datetime = Field(
         sa_column=Column(DateTime(), server_default=func.now())
@@ -81,9 +149,11 @@ class DbArchive(SQLModel, table=True):
 
     def from_work(self, work: DbWork):
         self.work_id = work.work_id
+        self.namespace = work.namespace
         self.status = work.status
         self.tool_id = work.tool.tool_id
         self.task_id = work.task.task_id
+        self.needs_hash = work.task.needs_hash
         self.task_needs = work.task.task_needs
         self.tool_skills = work.tool.tool_skills
         self.reports = {"reports": self._make_reports_list(work.reports)}
@@ -99,3 +169,99 @@ class DbArchive(SQLModel, table=True):
             }
             for rpt in reports
         ]
+
+
+class DbRequestKey(SQLModel, table=True):
+    __tablename__ = "request_keys"
+    request_key: str = Field(primary_key=True)
+    route: str = Field(primary_key=True)
+    response: Dict = Field(sa_column=Column(JSON))
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+
+
+class DbSkillIndex(SQLModel, table=True):
+    """Inverted index from skill key/value pairs to available tools"""
+
+    __tablename__ = "tool_skill_index"
+    skill_key: str = Field(primary_key=True)
+    tool_id: str = Field(primary_key=True, index=True)
+
+
+class DbTaskDep(SQLModel, table=True):
+    """Dependency of a task on an upstream task that has not succeeded yet"""
+
+    __tablename__ = "task_deps"
+    task_id: str = Field(primary_key=True, foreign_key="tasks.task_id")
+    depends_on: str = Field(primary_key=True, index=True)
+
+
+class DbNeedIndex(SQLModel, table=True):
+    """Inverted index from need key/value pairs to unassigned tasks"""
+
+    __tablename__ = "task_need_index"
+    need_key: str = Field(primary_key=True)
+    task_id: str = Field(primary_key=True, index=True)
+    need_count: int
+
+
+class DbTableVersion(SQLModel, table=True):
+    """Change counter per table, used to answer conditional requests cheaply"""
+
+    __tablename__ = "table_versions"
+    name: str = Field(primary_key=True)
+    version: int = Field(sa_column=Column(BigInteger, nullable=False))
+
+
+class DbToolStats(SQLModel, table=True):
+    """Rollup of archived work per tool and skills signature (times in seconds)"""
+
+    __tablename__ = "tool_stats"
+    tool_id: str = Field(primary_key=True)
+    skills_signature: str = Field(primary_key=True)
+    completed: int = Field(default=0)
+    succeeded: int = Field(default=0)
+    failed: int = Field(default=0)
+    total_wait: float = Field(default=0.0)
+    total_run: float = Field(default=0.0)
+    max_wait: float = Field(default=0.0)
+    max_run: float = Field(default=0.0)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class DbQueueBucket(SQLModel, table=True):
+    """Tasks entering and leaving the queue per needs signature and time bucket"""
+
+    __tablename__ = "queue_buckets"
+    needs_hash: str = Field(primary_key=True)
+    bucket_start: datetime = Field(primary_key=True, index=True)
+    arrivals: int = Field(default=0)
+    departures: int = Field(default=0)
+
+
+class DbBlob(SQLModel, table=True):
+    """Content-addressed payload, data is null when the blob is kept on disk"""
+
+    __tablename__ = "blobs"
+    blob_hash: str = Field(primary_key=True)
+    size: int
+    data: bytes | None = Field(default=None, sa_column=Column(LargeBinary))
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class DbRateBucket(SQLModel, table=True):
+    """Token bucket state shared by all service processes"""
+
+    __tablename__ = "rate_buckets"
+    bucket_key: str = Field(primary_key=True)
+    tokens: float
+    updated_at: float
+
+
+class DbMemo(SQLModel, table=True):
+    """Most recent successful work per needs and skills fingerprint"""
+
+    __tablename__ = "memo_index"
+    needs_hash: str = Field(primary_key=True)
+    skills_signature: str = Field(primary_key=True)
+    work_id: int
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
@@ -0,0 +1,123 @@
+import logging
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from db_config import SLOW_QUERY_TIME
+
+""" Opt-in profiling of SQL statements per access method and route (SQL_PROFILE=1) """
+
+logger = logging.getLogger(__name__)
+
+# route template of the request being handled, set by the api layer
+current_route: ContextVar[str] = ContextVar("current_route", default="-")
+
+# modules whose functions statements are attributed to
+PROFILED_MODULES = ("db_access.py", "api_models.py")
+
+# statements whose plan is logged when they are slow
+EXPLAINED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+class QueryProfile:
+    """Statement count, rows and time aggregated per route and calling method"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[tuple[str, str], list] = {}
+
+    def record(self, route: str, method: str, rows: int, elapsed: float):
+        with self._lock:
+            stats = self._stats.setdefault((route, method), [0, 0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += max(rows, 0)
+            stats[2] += elapsed
+            stats[3] = max(stats[3], elapsed)
+
+    def top(self, n: int = 20, order: str = "total_time") -> list[dict]:
+        with self._lock:
+            items = [
+                {
+                    "route": route,
+                    "method": method,
+                    "statements": count,
+                    "rows": rows,
+                    "total_time": total,
+                    "mean_time": total / count,
+                    "max_time": longest,
+                }
+                for (route, method), (count, rows, total, longest) in self._stats.items()
+            ]
+        return sorted(items, key=lambda item: item[order], reverse=True)[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+query_profile = QueryProfile()
+
+
+def enable_profiling(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _calling_method() -> str:
+    frame = sys._getframe(2)
+    while frame:
+        if frame.f_code.co_filename.endswith(PROFILED_MODULES):
+            return frame.f_code.co_qualname
+        frame = frame.f_back
+    return "-"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    route = current_route.get()
+    method = _calling_method()
+    query_profile.record(route, method, cursor.rowcount, elapsed)
+    if elapsed >= SLOW_QUERY_TIME:
+        plan = "" if executemany else _explain(conn, cursor, statement, parameters)
+        logger.warning(
+            "Slow query (%.3fs) in %s for %s:\n%s\n%s",
+            elapsed,
+            method,
+            route,
+            statement,
+            plan,
+        )
+
+
+def _explain(conn, cursor, statement, parameters) -> str:
+    """
+    Get the plan of a statement on a separate DBAPI cursor so that the
+    explain itself is not profiled. The explain runs in a savepoint, so that
+    a failing one does not abort the transaction of the request.
+    """
+    if not statement.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+        return ""
+    if conn.dialect.name == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        prefix = "EXPLAIN "
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute("SAVEPOINT explain_plan")
+        try:
+            explain_cursor.execute(prefix + statement, parameters)
+            rows = explain_cursor.fetchall()
+        finally:
+            explain_cursor.execute("ROLLBACK TO SAVEPOINT explain_plan")
+            explain_cursor.execute("RELEASE SAVEPOINT explain_plan")
+    except Exception as e:
+        return f"(no plan: {e})"
+    finally:
+        explain_cursor.close()
+    return "\n".join(" ".join(str(col) for col in row) for row in rows)
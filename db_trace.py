@@ -0,0 +1,275 @@
+import functools
+import json
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from db_config import TRACE_BUFFER, TRACE_EXPORTER, TRACE_FILE, TRACE_SAMPLE_RATE
+
+"""
+Tracing of requests, access methods, response building and SQL statements
+(TRACE_SAMPLE_RATE > 0). Spans follow the OpenTelemetry data model and are
+exported as OTLP-style JSON.
+"""
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: str | None,
+        sampled: bool,
+        kind: str = "internal",
+        attributes: dict | None = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.status = "OK"
+        self.message = None
+        self.start = time.time_ns()
+        self.end = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, error: Exception):
+        self.status = "ERROR"
+        self.message = f"{type(error).__name__}: {error}"
+
+    def finish(self):
+        self.end = time.time_ns()
+
+    def traceparent(self) -> str:
+        """W3C trace context header naming this span"""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start,
+            "endTimeUnixNano": self.end,
+            "durationMs": (self.end - self.start) / 1e6 if self.end else None,
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.message},
+        }
+
+
+class MemoryExporter:
+    """Keeps the most recent spans, a stand-in for a collector"""
+
+    def __init__(self, size: int = TRACE_BUFFER):
+        self._spans = deque(maxlen=size)
+
+    def export(self, span: Span):
+        self._spans.append(span.to_dict())
+
+    def get_spans(self, trace_id: str | None = None) -> list[dict]:
+        spans = list(self._spans)
+        if trace_id:
+            spans = [span for span in spans if span["traceId"] == trace_id]
+        return spans
+
+    def clear(self):
+        self._spans.clear()
+
+
+class FileExporter:
+    """Appends one JSON span per line to a file"""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a") as file:
+                file.write(line + "\n")
+
+    def get_spans(self, trace_id: str | None = None) -> list[dict]:
+        return []
+
+    def clear(self):
+        pass
+
+
+# span of the code that is running, set for the duration of each span
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, sample_rate: float, exporter):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def start_span(
+        self,
+        name: str,
+        kind: str = "internal",
+        traceparent: str | None = None,
+        **attributes,
+    ) -> Span:
+        """
+        Start a span below the current span, or below the remote parent of a
+        traceparent header, or as the root of a new trace. Children follow the
+        sampling decision of their parent.
+        """
+        parent = current_span.get()
+        if parent:
+            return Span(name, parent.trace_id, parent.span_id, parent.sampled, kind, attributes)
+        remote = parse_traceparent(traceparent)
+        if remote:
+            trace_id, parent_id, sampled = remote
+        else:
+            trace_id = secrets.token_hex(16)
+            parent_id = None
+            sampled = random.random() < self.sample_rate
+        return Span(name, trace_id, parent_id, sampled, kind, attributes)
+
+    def end_span(self, span: Span):
+        span.finish()
+        if span.sampled:
+            self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", traceparent: str | None = None, **attributes):
+        span = self.start_span(name, kind, traceparent, **attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set_error(e)
+            raise
+        finally:
+            current_span.reset(token)
+            self.end_span(span)
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def _make_exporter(name: str):
+    if name == "file":
+        return FileExporter()
+    if name != "memory":
+        raise ValueError(f"Unknown trace exporter '{name}'")
+    return MemoryExporter()
+
+
+tracer = Tracer(TRACE_SAMPLE_RATE, _make_exporter(TRACE_EXPORTER))
+
+
+def traced(name: str):
+    """Decorator that runs the function in a span when tracing is enabled"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def untraced(func):
+    """
+    Keep a method out of traced_class, e.g. one that only builds a SQL
+    expression or does no database work.
+    """
+    func.untraced = True
+    return func
+
+
+def traced_class(prefix: str = ""):
+    """
+    Class decorator that traces the public methods (static or not) whose names
+    start with the prefix, as "<class>.<method>" spans. Methods whose names
+    start with "_" and those marked @untraced are left alone.
+    """
+
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_") or not attr.startswith(prefix):
+                continue
+            name = f"{cls.__name__}.{attr}"
+            if isinstance(value, staticmethod):
+                if not getattr(value.__func__, "untraced", False):
+                    setattr(cls, attr, staticmethod(traced(name)(value.__func__)))
+            elif callable(value) and not getattr(value, "untraced", False):
+                setattr(cls, attr, traced(name)(value))
+        return cls
+
+    return decorator
+
+
+def enable_tracing(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not tracer.enabled or current_span.get() is None:
+        return
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+    span = tracer.start_span(
+        f"SQL {verb}",
+        kind="client",
+        **{
+            "db.system": conn.dialect.name,
+            "db.statement": statement[:2000],
+            "db.executemany": executemany,
+        },
+    )
+    conn.info.setdefault("trace_spans", []).append(span)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if not spans:
+        return
+    span = spans.pop()
+    span.set_attribute("db.rows", cursor.rowcount)
+    tracer.end_span(span)
+
+
+def _handle_error(context):
+    spans = context.connection.info.get("trace_spans") if context.connection else None
+    if not spans:
+        return
+    span = spans.pop()
+    span.set_error(context.original_exception)
+    tracer.end_span(span)
@@ -1,4 +1,9 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
+from api_base import set_current_route
+from api_config import CAPTURE
+from api_jobs import lifespan
+from api_limits import RateLimitMiddleware
+from api_middleware import CaptureMiddleware, CompressionMiddleware
 from api_endpts import (
     tool_router,
     task_router,
@@ -6,10 +11,16 @@ from api_endpts import (
     archive_router,
     report_router,
     general_router,
+    blob_router,
 )
 
 
-app = FastAPI()
+app = FastAPI(dependencies=[Depends(set_current_route)], lifespan=lifespan)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RateLimitMiddleware)
+if CAPTURE:
+    # outermost, so that rate limited and shed calls are recorded too
+    app.add_middleware(CaptureMiddleware)
 
 
 app.include_router(general_router)
@@ -18,3 +29,4 @@ app.include_router(task_router)
 app.include_router(work_router)
 app.include_router(archive_router)
 app.include_router(report_router)
+app.include_router(blob_router)
@@ -0,0 +1,267 @@
+import argparse
+import base64
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+"""
+Play back a capture of API calls (recorded with CAPTURE=1) against a running
+instance, at the captured pace or faster, and compare the latency and
+throughput of the replay with those of the capture.
+
+Calls are sent in capture order at their captured offsets (divided by the
+speed), so replaying against an instance that starts from the same database
+state as the captured one produces the same tools, tasks and work ids. With
+--workers 1 the calls are also completed in order, at the cost of falling
+behind the schedule when the instance is slower than the capture.
+
+Captured times are measured in the service and replayed times at the client,
+so the latter include the client and local network overhead. For like-for-like
+figures run the target with CAPTURE=1 too and compare the two captures with
+--against.
+"""
+
+
+def load_capture(path: str) -> list[dict]:
+    with open(path) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    return sorted(records, key=lambda record: record["ts"])
+
+
+def decode_body(record: dict) -> bytes | None:
+    if "body_b64" in record:
+        return base64.b64decode(record["body_b64"])
+    if "body" in record:
+        return record["body"].encode()
+    return None
+
+
+def percentile(values: list[float], fraction: float) -> float | None:
+    """Nearest-rank percentile of unsorted values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class Replayer:
+    def __init__(
+        self, target: str, speed: float = 1.0, workers: int = 16, timeout: float = 60
+    ):
+        self.target = target.rstrip("/")
+        self.speed = speed
+        self.workers = workers
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def send(self, record: dict, lag: float) -> dict:
+        url = f"{self.target}{record['path']}"
+        if record.get("query"):
+            url = f"{url}?{record['query']}"
+        start = time.perf_counter()
+        try:
+            response = self._session().request(
+                record["method"],
+                url,
+                data=decode_body(record),
+                headers=record.get("headers", {}),
+                timeout=self.timeout,
+            )
+            status = response.status_code
+        except requests.RequestException:
+            status = 0
+        return {
+            "route": record.get("route", record["path"]),
+            "method": record["method"],
+            "status": status,
+            "duration_ms": (time.perf_counter() - start) * 1000,
+            "lag_ms": lag * 1000,
+        }
+
+    def run(self, records: list[dict]) -> tuple[list[dict], float]:
+        """Send the calls on schedule, returning their results and the elapsed time"""
+        if not records:
+            return [], 0.0
+        first = records[0]["ts"]
+        start = time.perf_counter()
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for record in records:
+                due = (record["ts"] - first) / self.speed if self.speed > 0 else 0.0
+                wait = due - (time.perf_counter() - start)
+                if wait > 0:
+                    time.sleep(wait)
+                lag = max(time.perf_counter() - start - due, 0.0)
+                futures.append(executor.submit(self.send, record, lag))
+            results = [future.result() for future in futures]
+        return results, time.perf_counter() - start
+
+
+def capture_elapsed(records: list[dict]) -> float:
+    """Time from the first call of a capture until its last call completed"""
+    if not records:
+        return 0.0
+    end = max(record["ts"] + record.get("duration_ms", 0) / 1000 for record in records)
+    return end - records[0]["ts"]
+
+
+def summarize(results: list[dict], elapsed: float) -> dict:
+    by_route = defaultdict(list)
+    for result in results:
+        by_route[f"{result['method']} {result['route']}"].append(result)
+    routes = {}
+    for route, items in sorted(by_route.items()):
+        times = [item["duration_ms"] for item in items]
+        routes[route] = {
+            "calls": len(items),
+            "errors": sum(
+                1 for item in items if not item["status"] or item["status"] >= 500
+            ),
+            "p50_ms": percentile(times, 0.5),
+            "p95_ms": percentile(times, 0.95),
+            "p99_ms": percentile(times, 0.99),
+            "max_ms": max(times),
+        }
+    times = [result["duration_ms"] for result in results]
+    return {
+        "calls": len(results),
+        "elapsed_s": elapsed,
+        "throughput": len(results) / elapsed if elapsed > 0 else None,
+        "p50_ms": percentile(times, 0.5),
+        "p95_ms": percentile(times, 0.95),
+        "p99_ms": percentile(times, 0.99),
+        "max_lag_ms": max((result.get("lag_ms", 0) for result in results), default=0),
+        "routes": routes,
+    }
+
+
+def compare(
+    captured: list[dict],
+    replayed: list[dict],
+    captured_s: float,
+    replayed_s: float,
+    speed: float,
+) -> dict:
+    """
+    Summaries of the capture and the replay, and the calls whose status
+    differs between them (a replay that started from a different state).
+    """
+    mismatches = [
+        {
+            "index": index,
+            "route": f"{old['method']} {old.get('route', old['path'])}",
+            "captured": old["status"],
+            "replayed": new["status"],
+        }
+        for index, (old, new) in enumerate(zip(captured, replayed))
+        if old["status"] != new["status"]
+    ]
+    return {
+        "speed": speed,
+        "captured": summarize(captured, captured_s),
+        "replayed": summarize(replayed, replayed_s),
+        "status_mismatches": mismatches,
+    }
+
+
+def _change(old: float | None, new: float | None) -> str:
+    if old is None or new is None:
+        return "-"
+    if old == 0:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def _ms(value: float | None) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def print_report(report: dict):
+    old, new = report["captured"], report["replayed"]
+    expected = None
+    if old["throughput"] and report["speed"]:
+        expected = old["throughput"] * report["speed"]
+    print(f"calls: {old['calls']} captured, {new['calls']} replayed at {report['speed']}x")
+    print(
+        f"throughput (calls/s): captured {_ms(old['throughput'])}, "
+        f"replayed {_ms(new['throughput'])}, expected {_ms(expected)}"
+    )
+    for name in ("p50_ms", "p95_ms", "p99_ms"):
+        print(
+            f"{name}: captured {_ms(old[name])}, replayed {_ms(new[name])} "
+            f"({_change(old[name], new[name])})"
+        )
+    print(f"largest dispatch lag behind schedule: {_ms(new['max_lag_ms'])} ms")
+    print()
+    columns = ["calls", "p50 old", "p50 new", "p95 old", "p95 new", "change"]
+    widths = [6, 9, 9, 9, 9, 7]
+    print(f"{'route':<50} " + " ".join(f"{c:>{w}}" for c, w in zip(columns, widths)))
+    for route, stats in new["routes"].items():
+        before = old["routes"].get(route, {})
+        print(
+            f"{route:<50} {stats['calls']:>6} {_ms(before.get('p50_ms')):>9} "
+            f"{_ms(stats['p50_ms']):>9} {_ms(before.get('p95_ms')):>9} "
+            f"{_ms(stats['p95_ms']):>9} {_change(before.get('p95_ms'), stats['p95_ms']):>7}"
+        )
+    mismatches = report["status_mismatches"]
+    if mismatches:
+        print()
+        print(f"{len(mismatches)} calls returned a different status, the first ones:")
+        for item in mismatches[:10]:
+            print(
+                f"  #{item['index']} {item['route']}: "
+                f"{item['captured']} -> {item['replayed']}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a capture of API calls and compare latency and throughput"
+    )
+    parser.add_argument("capture", help="capture file written with CAPTURE=1")
+    parser.add_argument(
+        "--target", default="http://localhost:8080", help="instance to replay against"
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="pace multiplier, 0 sends as fast as possible",
+    )
+    parser.add_argument("--workers", type=int, default=16, help="calls in flight at most")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument(
+        "--against",
+        default=None,
+        help="compare with a capture taken on the other instance instead of replaying",
+    )
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    captured = load_capture(args.capture)
+    if args.against:
+        replayed = load_capture(args.against)
+        replayed_s = capture_elapsed(replayed)
+    else:
+        replayer = Replayer(args.target, args.speed, args.workers, args.timeout)
+        replayed, replayed_s = replayer.run(captured)
+    report = compare(
+        captured, replayed, capture_elapsed(captured), replayed_s, args.speed
+    )
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+import sys
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_base  # noqa: E402
+import db_config  # noqa: E402
+import main  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """API client on a fresh sqlite database, without the background jobs"""
+    monkeypatch.setattr(db_config, "SQLITE_PATH", str(tmp_path / "rho.db"))
+    db_base.use_backend("sqlite")
+    yield TestClient(main.app)
+    db_base.engine.dispose()
+
+
+@pytest.fixture
+def tool(client):
+    """A ready tool with three work slots and no skills"""
+    client.post("/tool/create/", json={"tool_id": "t", "tool_skills": {}, "capacity": 3})
+    client.put("/tool/update/ready/t")
+    return "t"
+
+
+def create_task(client, task_id: str, **fields):
+    response = client.post(
+        "/task/create/", json={"task_id": task_id, "task_needs": {"id": task_id}, **fields}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def create_work(client, tool_id: str, task_id: str) -> int:
+    response = client.post("/work/create/batch", json=[{"tool_id": tool_id, "task_id": task_id}])
+    assert response.status_code == 200, response.text
+    return response.json()["work_ids"][0]
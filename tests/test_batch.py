@@ -0,0 +1,36 @@
+from conftest import create_task
+
+
+def test_batch_creates_valid_pairs_and_reports_conflicts(client, tool):
+    client.post("/tool/create/", json={"tool_id": "idle", "tool_skills": {}})
+    for task_id in ("a", "b", "c"):
+        create_task(client, task_id)
+    pairs = [
+        {"tool_id": tool, "task_id": "a"},
+        {"tool_id": tool, "task_id": "a"},
+        {"tool_id": tool, "task_id": "missing"},
+        {"tool_id": "idle", "task_id": "b"},
+        {"tool_id": "nope", "task_id": "c"},
+        {"tool_id": tool, "task_id": "c"},
+    ]
+    outcome = client.post("/work/create/batch", json=pairs).json()
+
+    assert not outcome["success"]
+    assert len(outcome["work_ids"]) == 2
+    reasons = {(c["tool_id"], c["task_id"]): c["reason"] for c in outcome["conflicts"]}
+    assert reasons.keys() == {(tool, "a"), (tool, "missing"), ("idle", "b"), ("nope", "c")}
+    assert "already assigned" in reasons[(tool, "a")]
+    assert "not available" in reasons[("idle", "b")]
+    assert "does not exist" in reasons[("nope", "c")]
+    assert {work["task_id"] for work in client.get("/work/list/").json()} == {"a", "c"}
+
+
+def test_batch_respects_free_slots(client, tool):
+    for task_id in ("a", "b", "c", "d"):
+        create_task(client, task_id)
+    pairs = [{"tool_id": tool, "task_id": task_id} for task_id in ("a", "b", "c", "d")]
+    outcome = client.post("/work/create/batch", json=pairs).json()
+
+    assert len(outcome["work_ids"]) == 3
+    assert [c["task_id"] for c in outcome["conflicts"]] == ["d"]
+    assert "no free work slots" in outcome["conflicts"][0]["reason"]
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import Session
+
+import db_access
+import db_base
+from conftest import create_task
+
+
+def test_unchanged_task_list_is_not_modified(client):
+    create_task(client, "a")
+    first = client.get("/task/list/available")
+    etag = first.headers["ETag"]
+
+    response = client.get("/task/list/available", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    create_task(client, "b")
+    response = client.get("/task/list/available", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert {task["task_id"] for task in response.json()} == {"a", "b"}
+
+
+def test_unchanged_tool_list_is_not_modified(client, tool):
+    etag = client.get("/tool/list/available").headers["ETag"]
+    response = client.get("/tool/list/available", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.put(f"/tool/update/disable/{tool}")
+    response = client.get("/tool/list/available", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_heartbeats_change_the_tool_list_only_when_liveness_changes(client, tool):
+    def heartbeat(age: float):
+        with Session(db_base.engine) as session:
+            seen = {tool: datetime.now() - timedelta(seconds=age)}
+            db_access.ToolAccess.record_heartbeats(seen, session)
+
+    etag = client.get("/tool/list/available").headers["ETag"]
+    heartbeat(0)
+    response = client.get("/tool/list/available", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    heartbeat(2 * db_access.TOOL_LIVENESS_TTL)  # the heartbeat expires
+    response = client.get("/tool/list/available", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == []
+
+    etag = response.headers["ETag"]
+    heartbeat(0)
+    response = client.get("/tool/list/available", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [item["tool_id"] for item in response.json()] == [tool]
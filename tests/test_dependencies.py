@@ -0,0 +1,37 @@
+from conftest import create_task, create_work
+
+
+def succeed(client, tool_id: str, task_id: str, details: dict) -> None:
+    work_id = create_work(client, tool_id, task_id)
+    client.post(f"/report/create/{work_id}", json={"status": "succeeded", "details": details})
+    assert client.put(f"/work/update/successful/{work_id}").status_code == 200
+    client.put(f"/tool/update/ready/{tool_id}")  # completing work ends the ready state
+
+
+def test_dependent_waits_for_every_upstream_task(client, tool):
+    create_task(client, "a")
+    create_task(client, "b")
+    create_task(client, "c", depends_on=["a", "b"])
+    assert client.get("/task/details/c").json()["pending_deps"] == 2
+
+    succeed(client, tool, "a", {"out": 1})
+    assert client.get("/task/details/c").json()["pending_deps"] == 1
+    response = client.post("/work/create/", json={"tool_id": tool, "task_id": "c"})
+    assert response.status_code == 409
+    assert "waiting for 1 upstream tasks" in response.json()["detail"]
+
+    succeed(client, tool, "b", {"out": 2})
+    assert client.get("/task/details/c").json()["pending_deps"] == 0
+    work_id = create_work(client, tool, "c")
+    upstream = client.get(f"/work/details/{work_id}").json()["upstream"]
+    assert upstream == {"a": {"out": 1}, "b": {"out": 2}}
+
+
+def test_dependent_of_a_finished_task_is_released_at_once(client, tool):
+    create_task(client, "a")
+    succeed(client, tool, "a", {"out": 1})
+
+    create_task(client, "c", depends_on=["a"])
+    assert client.get("/task/details/c").json()["pending_deps"] == 0
+    work_id = create_work(client, tool, "c")
+    assert client.get(f"/work/details/{work_id}").json()["upstream"] == {"a": {"out": 1}}
@@ -0,0 +1,29 @@
+from conftest import create_task, create_work
+
+
+def test_replayed_create_returns_the_stored_outcome(client):
+    headers = {"Idempotency-Key": "create-1"}
+    first = client.post(
+        "/task/create/", json={"task_id": "a", "task_needs": {"id": "a"}}, headers=headers
+    )
+    assert first.status_code == 200
+    replay = client.post(
+        "/task/create/", json={"task_id": "b", "task_needs": {"id": "b"}}, headers=headers
+    )
+    assert replay.status_code == 200
+    assert replay.json() == first.json()
+    assert [task["task_id"] for task in client.get("/task/list/").json()] == ["a"]
+
+
+def test_replayed_completion_returns_the_stored_outcome(client, tool):
+    create_task(client, "k")
+    work_id = create_work(client, tool, "k")
+    client.post(f"/report/create/{work_id}", json={"status": "succeeded", "details": {}})
+    headers = {"Idempotency-Key": "done-1"}
+    first = client.put(f"/work/update/successful/{work_id}", headers=headers)
+    assert first.status_code == 200
+
+    assert client.put(f"/work/update/failed/{work_id}").status_code == 409
+    replay = client.put(f"/work/update/successful/{work_id}", headers=headers)
+    assert replay.status_code == 200
+    assert replay.json() == first.json()
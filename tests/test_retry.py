@@ -0,0 +1,39 @@
+from sqlmodel import Session
+
+import db_access
+import db_base
+from conftest import create_task, create_work
+
+
+def available_task_ids(client) -> set[str]:
+    return {task["task_id"] for task in client.get("/task/list/available").json()}
+
+
+def test_failed_task_waits_for_backoff_then_is_promoted(client, tool, monkeypatch):
+    monkeypatch.setattr(db_access, "RETRY_BACKOFF_BASE", 0.0)
+    create_task(client, "k")
+    work_id = create_work(client, tool, "k")
+    client.post(f"/report/create/{work_id}", json={"status": "failed", "details": {}})
+    assert client.put(f"/work/update/failed/{work_id}").status_code == 200
+
+    task = client.get("/task/details/k").json()
+    assert task["attempts"] == 1
+    assert task["eligible_at"] is not None
+    assert "k" not in available_task_ids(client)
+
+    with Session(db_base.engine) as session:
+        assert db_access.TaskAccess.promote_due_tasks(session) == 1
+    assert client.get("/task/details/k").json()["eligible_at"] is None
+    assert "k" in available_task_ids(client)
+
+
+def test_task_is_dead_lettered_after_its_last_attempt(client, tool):
+    create_task(client, "k", max_attempts=1)
+    work_id = create_work(client, tool, "k")
+    client.post(f"/report/create/{work_id}", json={"status": "failed", "details": {}})
+    client.put(f"/work/update/failed/{work_id}")
+
+    assert [task["task_id"] for task in client.get("/task/list/dead").json()] == ["k"]
+    assert "k" not in available_task_ids(client)
+    assert client.put("/task/update/requeue/k").status_code == 200
+    assert "k" in available_task_ids(client)
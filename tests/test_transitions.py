@@ -0,0 +1,36 @@
+from conftest import create_task, create_work
+
+
+def test_report_after_success_is_rejected(client, tool):
+    create_task(client, "k")
+    work_id = create_work(client, tool, "k")
+    report = {"status": "processing", "details": {}}
+    assert client.post(f"/report/create/{work_id}", json=report).status_code == 200
+    report = {"status": "succeeded", "details": {}}
+    assert client.post(f"/report/create/{work_id}", json=report).status_code == 200
+
+    response = client.post(
+        f"/report/create/{work_id}", json={"status": "processing", "details": {}}
+    )
+    assert response.status_code == 409
+    assert "cannot go from succeeded to processing" in response.json()["detail"]
+
+
+def test_completion_must_match_reported_status(client, tool):
+    create_task(client, "k")
+    work_id = create_work(client, tool, "k")
+    client.post(f"/report/create/{work_id}", json={"status": "succeeded", "details": {}})
+
+    assert client.put(f"/work/update/failed/{work_id}").status_code == 409
+    assert client.put(f"/work/update/successful/{work_id}").status_code == 200
+    # completing again is harmless, completing the other way is not
+    assert client.put(f"/work/update/successful/{work_id}").status_code == 200
+    assert client.put(f"/work/update/failed/{work_id}").status_code == 409
+    assert client.get(f"/archive/details/{work_id}").json()["status"] == "succeeded"
+
+
+def test_unknown_status_is_rejected(client, tool):
+    create_task(client, "k")
+    work_id = create_work(client, tool, "k")
+    response = client.post(f"/report/create/{work_id}", json={"status": "bogus", "details": {}})
+    assert response.status_code == 409